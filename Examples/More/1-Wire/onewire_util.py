@@ -0,0 +1,250 @@
+"""
+1-Wire bus enumeration and batched DS18B20/DS1822 temperature reads.
+
+OneWireBus.search enumerates every device on the bus with the ROM search
+function, one eNames call per device found, and caches their ROM IDs.
+OneWireBus.readTemperatures starts a conversion on all sensors at once
+with a Skip ROM command, waits once, and then reads every sensor's
+scratchpad with ROM matching in a single eNames call.
+
+Example:
+
+    bus = OneWireBus(handle, dqDIONum=8)
+    bus.search()
+    for rom, tempC in zip(bus.roms, bus.readTemperatures()):
+        print("%016X: %s C" % (rom, tempC))
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Multiple Value Functions (such as eNames):
+        https://labjack.com/support/software/api/ljm/function-reference/multiple-value-functions
+
+T-Series and I/O:
+    1-Wire:
+        https://labjack.com/support/datasheets/t-series/digital-io/1-wire
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+from time import sleep
+
+from labjack import ljm
+
+# ROM functions.
+SEARCH_ROM = 0xF0
+SKIP_ROM = 0xCC
+MATCH_ROM = 0x55
+
+# DS18B20/DS1822 commands.
+CONVERT_T = 0x44
+READ_SCRATCHPAD = 0xBE
+
+# DS18B20/DS1822 temperature register power-on reset value (85 C).
+POWER_ON_RESET_TEMP = 0x0550
+
+# 12-bit conversion time of the DS18B20/DS1822.
+CONVERSION_TIME = 0.75
+
+
+def _split64(value):
+    """Returns the (high, low) 32-bit halves of a 64-bit value."""
+    return (value >> 32) & 0xFFFFFFFF, value & 0xFFFFFFFF
+
+
+class OneWireBus(object):
+    """1-Wire bus of one device.
+
+    The values last written to the 1-Wire configuration registers are
+    cached, and an operation only writes the registers whose value
+    differs. If another program or script may change the 1-Wire
+    registers, or the device was power cycled, call invalidate.
+
+    Options:
+        bit 2: 1 = Dynamic pull-up enabled.
+        bit 3: Dynamic pull-up polarity.
+    """
+    def __init__(self, handle, dqDIONum, dpuDIONum=0, options=0):
+        self.handle = handle
+        self.roms = []
+        self._paths = {}
+        self._config = [("ONEWIRE_DQ_DIONUM", dqDIONum),
+                        ("ONEWIRE_DPU_DIONUM", dpuDIONum),
+                        ("ONEWIRE_OPTIONS", options)]
+        self._written = {}
+
+    def invalidate(self):
+        """Forgets the cached register values so that the next operation
+        writes the full configuration.
+        """
+        self._written = {}
+
+    def _operationFrames(self, written, function, aTXBytes=(), numRX=0,
+                         rom=0, path=0):
+        """Returns the (name, direction, values) frames of one 1-Wire
+        operation and updates written with the registers it writes.
+        """
+        romH, romL = _split64(rom)
+        pathH, pathL = _split64(path)
+        settings = self._config + [("ONEWIRE_FUNCTION", function),
+                                   ("ONEWIRE_NUM_BYTES_TX", len(aTXBytes)),
+                                   ("ONEWIRE_NUM_BYTES_RX", numRX)]
+        if function == MATCH_ROM:
+            settings += [("ONEWIRE_ROM_MATCH_H", romH),
+                         ("ONEWIRE_ROM_MATCH_L", romL)]
+        if function in (MATCH_ROM, SEARCH_ROM):
+            settings += [("ONEWIRE_PATH_H", pathH),
+                         ("ONEWIRE_PATH_L", pathL)]
+        frames = []
+        for name, value in settings:
+            if written.get(name) != value:
+                frames.append((name, ljm.constants.WRITE, [value]))
+                written[name] = value
+        if aTXBytes:
+            frames.append(("ONEWIRE_DATA_TX", ljm.constants.WRITE,
+                           list(aTXBytes)))
+        frames.append(("ONEWIRE_GO", ljm.constants.WRITE, [1]))
+        if numRX > 0:
+            frames.append(("ONEWIRE_DATA_RX", ljm.constants.READ, [0]*numRX))
+        return frames
+
+    def _execute(self, frames, written):
+        """Performs frames with one eNames call and returns the values
+        read, in order.
+        """
+        aNames = [frame[0] for frame in frames]
+        aWrites = [frame[1] for frame in frames]
+        aNumValues = [len(frame[2]) for frame in frames]
+        aValues = []
+        for frame in frames:
+            aValues.extend(frame[2])
+        try:
+            results = ljm.eNames(self.handle, len(aNames), aNames, aWrites,
+                                 aNumValues, aValues)
+        except ljm.LJMError:
+            # It is unknown which frames were performed.
+            self.invalidate()
+            raise
+        self._written = written
+        values = []
+        offset = 0
+        for i in range(len(frames)):
+            if aWrites[i] == ljm.constants.READ:
+                values.extend(results[offset:offset + aNumValues[i]])
+            offset += aNumValues[i]
+        return values
+
+    def _searchPath(self, path):
+        """Performs one ROM search along path and returns the
+        (rom, branchesFound) tuple.
+        """
+        written = dict(self._written)
+        frames = self._operationFrames(written, SEARCH_ROM, path=path)
+        for name in ["ONEWIRE_SEARCH_RESULT_H", "ONEWIRE_SEARCH_RESULT_L",
+                     "ONEWIRE_ROM_BRANCHS_FOUND_H",
+                     "ONEWIRE_ROM_BRANCHS_FOUND_L"]:
+            frames.append((name, ljm.constants.READ, [0]))
+        values = [int(x) for x in self._execute(frames, written)]
+        return (values[0] << 32) + values[1], (values[2] << 32) + values[3]
+
+    def search(self):
+        """Enumerates the devices on the bus and caches their ROM IDs.
+
+        The search is depth first over the ROM branch bits: each search
+        along a path reports the bits where devices' ROMs differ, and the
+        next path takes the 1 branch at the highest such bit where the 0
+        branch was taken, keeping the decisions below it.
+
+        Returns:
+            The list of ROM IDs found, also available as the roms
+            attribute.
+        """
+        roms = []
+        paths = {}
+        path = 0
+        while True:
+            rom, branches = self._searchPath(path)
+            if rom == 0:
+                break
+            if rom not in paths:
+                roms.append(rom)
+                paths[rom] = path
+            untaken = branches & ~path
+            if untaken == 0:
+                break
+            bit = 1
+            while untaken >> 1:
+                untaken >>= 1
+                bit <<= 1
+            path = (path & (bit - 1)) | bit
+        self.roms = roms
+        self._paths = paths
+        return roms
+
+    def convertAll(self):
+        """Starts a temperature conversion on every sensor on the bus at
+        once. Wait CONVERSION_TIME before reading the results.
+        """
+        written = dict(self._written)
+        frames = self._operationFrames(written, SKIP_ROM, [CONVERT_T])
+        self._execute(frames, written)
+
+    def readScratchpads(self, numBytes=2, roms=None):
+        """Reads the first numBytes scratchpad bytes of each sensor with one
+        eNames call.
+
+        Args:
+            numBytes: The number of scratchpad bytes to read from each
+                sensor. The first two are the temperature.
+            roms: The ROM IDs to read. Defaults to the IDs found by search.
+
+        Returns:
+            A list with the list of bytes read from each sensor.
+        """
+        if roms is None:
+            roms = self.roms
+        if not roms:
+            return []
+        written = dict(self._written)
+        frames = []
+        for rom in roms:
+            frames.extend(self._operationFrames(written, MATCH_ROM,
+                                                [READ_SCRATCHPAD], numBytes,
+                                                rom, self._paths.get(rom, 0)))
+        values = [int(x) for x in self._execute(frames, written)]
+        return [values[i:i + numBytes]
+                for i in range(0, len(values), numBytes)]
+
+    def readTemperatures(self, roms=None, conversionTime=CONVERSION_TIME):
+        """Converts and reads the temperature of every sensor.
+
+        Returns:
+            A list of temperatures in degrees C, in the order of roms (or
+            the roms attribute). A sensor that returned its power-on reset
+            value has a temperature of None.
+        """
+        self.convertAll()
+        sleep(conversionTime)
+        temperatures = []
+        for aBytes in self.readScratchpads(2, roms):
+            raw = aBytes[0] + (aBytes[1] << 8)
+            if raw == POWER_ON_RESET_TEMP:
+                temperatures.append(None)
+                continue
+            if raw & 0x8000:
+                raw -= 0x10000
+            temperatures.append(raw*0.0625)
+        return temperatures
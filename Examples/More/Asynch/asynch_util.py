@@ -0,0 +1,241 @@
+"""
+Stream-like Asynch (UART) port with background reception.
+
+AsynchPort configures the Asynch feature with one eWriteNames call,
+sends each write with one eNames call (ASYNCH_NUM_BYTES_TX, ASYNCH_DATA_TX
+and ASYNCH_TX_GO), and runs a thread that moves received bytes into a
+ring buffer that read takes from. Once bytes are known to be waiting, each
+poll is a single eNames call that reads them from ASYNCH_DATA_RX and reads
+the next ASYNCH_NUM_BYTES_RX.
+
+Example:
+
+    with AsynchPort(handle, rxDIONum=0, txDIONum=1, baud=19200) as port:
+        port.write(bytearray([0x01, 0x03, 0x00, 0x00, 0x00, 0x02, 0xC4, 0x0B]))
+        response = port.read(9, timeout=0.5)
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Multiple Value Functions (such as eNames):
+        https://labjack.com/support/software/api/ljm/function-reference/multiple-value-functions
+
+T-Series and I/O:
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+    Asynchronous Serial:
+        https://labjack.com/support/datasheets/t-series/digital-io/asynchronous-serial
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+import threading
+from time import time
+
+from labjack import ljm
+
+# Modbus Feedback overhead of a write: the MBAP header and function number,
+# and the ASYNCH_NUM_BYTES_TX, ASYNCH_DATA_TX and ASYNCH_TX_GO frames. Each
+# ASYNCH_DATA_TX/ASYNCH_DATA_RX byte takes one 16-bit register.
+_TX_OVERHEAD = 8 + 6 + 4 + 6
+_RX_OVERHEAD = 8 + 4 + 4 + 4
+
+
+class RingBuffer(object):
+    """Fixed-size byte FIFO. When full, the oldest bytes are dropped and
+    counted in numDropped.
+    """
+    def __init__(self, size):
+        self._buffer = bytearray(size)
+        self._size = size
+        self._start = 0
+        self._length = 0
+        self.numDropped = 0
+
+    def __len__(self):
+        return self._length
+
+    def write(self, data):
+        data = bytearray(data)
+        if len(data) > self._size:
+            self.numDropped += len(data) - self._size
+            data = data[-self._size:]
+        overflow = self._length + len(data) - self._size
+        if overflow > 0:
+            self.numDropped += overflow
+            self._start = (self._start + overflow) % self._size
+            self._length -= overflow
+        end = (self._start + self._length) % self._size
+        first = min(len(data), self._size - end)
+        self._buffer[end:end + first] = data[:first]
+        self._buffer[:len(data) - first] = data[first:]
+        self._length += len(data)
+
+    def read(self, numBytes=-1):
+        if numBytes < 0 or numBytes > self._length:
+            numBytes = self._length
+        first = min(numBytes, self._size - self._start)
+        data = self._buffer[self._start:self._start + first] + \
+            self._buffer[:numBytes - first]
+        self._start = (self._start + numBytes) % self._size
+        self._length -= numBytes
+        return data
+
+
+class AsynchPort(object):
+    """Asynch (UART) port of one device with a file-like interface.
+
+    Args:
+        handle: A valid handle to an open device.
+        rxDIONum, txDIONum: The DIO numbers of the RX and TX lines.
+        baud, numDataBits, parity, numStopBits: The serial format.
+            parity is 0 (none), 1 (odd) or 2 (even).
+        rxBufferSizeBytes: The device's RX buffer size, or None to leave
+            ASYNCH_RX_BUFFER_SIZE_BYTES unchanged.
+        ringSize: The size of the host receive buffer.
+        pollInterval: Seconds between ASYNCH_NUM_BYTES_RX polls while no
+            data is waiting. Data that keeps arriving is read without
+            waiting.
+    """
+    def __init__(self, handle, rxDIONum, txDIONum, baud=9600, numDataBits=8,
+                 parity=0, numStopBits=1, rxBufferSizeBytes=None,
+                 ringSize=65536, pollInterval=0.005):
+        self.handle = handle
+        self.pollInterval = pollInterval
+        self.error = None
+        self._config = [("ASYNCH_RX_DIONUM", rxDIONum),
+                        ("ASYNCH_TX_DIONUM", txDIONum),
+                        ("ASYNCH_BAUD", baud),
+                        ("ASYNCH_NUM_DATA_BITS", numDataBits),
+                        ("ASYNCH_PARITY", parity),
+                        ("ASYNCH_NUM_STOP_BITS", numStopBits)]
+        if rxBufferSizeBytes is not None:
+            self._config.append(("ASYNCH_RX_BUFFER_SIZE_BYTES",
+                                 rxBufferSizeBytes))
+        self._rx = RingBuffer(ringSize)
+        self._rxCondition = threading.Condition()
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+        maxBytesPerMB = ljm.getHandleInfo(handle)[5]
+        self._maxTX = max((maxBytesPerMB - _TX_OVERHEAD)//2, 1)
+        self._maxRX = max((maxBytesPerMB - _RX_OVERHEAD)//2, 1)
+
+    def open(self):
+        """Configures and enables the Asynch feature and starts the
+        receive thread.
+        """
+        aNames = ["ASYNCH_ENABLE"] + [name for name, _ in self._config] + \
+            ["ASYNCH_ENABLE"]
+        aValues = [0] + [value for _, value in self._config] + [1]
+        ljm.eWriteNames(self.handle, len(aNames), aNames, aValues)
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stops the receive thread and disables the Asynch feature."""
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        ljm.eWriteName(self.handle, "ASYNCH_ENABLE", 0)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    @property
+    def inWaiting(self):
+        """The number of received bytes that can be read immediately."""
+        return len(self._rx)
+
+    @property
+    def numDropped(self):
+        """The number of received bytes dropped because the host receive
+        buffer was full.
+        """
+        return self._rx.numDropped
+
+    def write(self, data):
+        """Transmits data (a bytes-like object or list of byte values).
+        Each chunk that fits in one packet is sent with one eNames call.
+        """
+        data = bytearray(data)
+        for i in range(0, len(data), self._maxTX):
+            chunk = list(data[i:i + self._maxTX])
+            ljm.eNames(self.handle, 3,
+                       ["ASYNCH_NUM_BYTES_TX", "ASYNCH_DATA_TX",
+                        "ASYNCH_TX_GO"],
+                       [ljm.constants.WRITE]*3, [1, len(chunk), 1],
+                       [len(chunk)] + chunk + [1])
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self, numBytes=-1, timeout=0):
+        """Returns up to numBytes received bytes as a bytearray, or all
+        received bytes if numBytes is negative.
+
+        Waits up to timeout seconds (forever if None) for numBytes bytes
+        to arrive, then returns what has been received.
+
+        Raises:
+            LJMError: The receive thread stopped because of an error.
+        """
+        with self._rxCondition:
+            if numBytes > 0 and timeout != 0:
+                deadline = None
+                if timeout is not None:
+                    deadline = time() + timeout
+                while len(self._rx) < numBytes and self.error is None:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = deadline - time()
+                        if remaining <= 0:
+                            break
+                    self._rxCondition.wait(remaining)
+            if self.error is not None and len(self._rx) == 0:
+                raise self.error
+            return self._rx.read(numBytes)
+
+    def _run(self):
+        try:
+            numBytes = int(ljm.eReadName(self.handle, "ASYNCH_NUM_BYTES_RX"))
+            while not self._stopEvent.is_set():
+                if numBytes > 0:
+                    chunk = min(numBytes, self._maxRX)
+                    results = ljm.eNames(
+                        self.handle, 2,
+                        ["ASYNCH_DATA_RX", "ASYNCH_NUM_BYTES_RX"],
+                        [ljm.constants.READ, ljm.constants.READ],
+                        [chunk, 1], [0]*(chunk + 1))
+                    with self._rxCondition:
+                        self._rx.write(int(x) & 0xFF for x in results[:chunk])
+                        self._rxCondition.notify_all()
+                    numBytes = int(results[chunk])
+                    if numBytes > 0:
+                        continue
+                self._stopEvent.wait(self.pollInterval)
+                numBytes = int(ljm.eReadName(self.handle,
+                                             "ASYNCH_NUM_BYTES_RX"))
+        except ljm.LJMError as excep:
+            with self._rxCondition:
+                self.error = excep
+                self._rxCondition.notify_all()
@@ -0,0 +1,163 @@
+"""
+Declarative device configuration that only writes what differs.
+
+A ConfigProfile is an ordered list of register names and values. apply
+reads the current values of every register in the profile, compares them
+to the profile and writes only the registers that differ. Reads and writes
+are packed into as few eReadAddresses/eWriteAddresses calls as fit in the
+connection's maximum packet size, so applying a profile to a device that
+is already configured costs only the read calls.
+
+Example:
+
+    profile = ConfigProfile([("AIN_ALL_RANGE", 10),
+                             ("AIN_ALL_RESOLUTION_INDEX", 8),
+                             ("AIN_ALL_NEGATIVE_CH", 199)])
+    changes = profile.apply(handle)
+
+    profile = ConfigProfile.fromJSON(open("watchdog.json").read())
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer:
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Multiple Value Functions (such as eReadAddresses and eWriteAddresses):
+        https://labjack.com/support/software/api/ljm/function-reference/multiple-value-functions
+    Utility Functions (such as namesToAddresses):
+        https://labjack.com/support/software/api/ljm/function-reference/utility
+
+T-Series and I/O:
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+import json
+import struct
+
+from labjack import ljm
+from labjack.ljm import packing
+
+def _packets(aDataTypes, maxBytesPerMB, write):
+    """Returns the list of frame index lists of each packet, in order."""
+    numFrames = len(aDataTypes)
+    return packing.planPackets(maxBytesPerMB, aDataTypes, [write]*numFrames,
+                               [1]*numFrames)
+
+
+def _sameValue(dataType, current, desired):
+    """Returns True if the read value current equals desired."""
+    if dataType == ljm.constants.FLOAT32:
+        desired = struct.unpack("<f", struct.pack("<f", desired))[0]
+        return current == desired
+    return int(current) == int(desired)
+
+
+class ConfigProfile(object):
+    """An ordered list of (name, value) register writes.
+
+    A name may be listed more than once, for example to disable a feature
+    before configuring it and enable it last. Such repeated registers are
+    written at every occurrence whenever anything in the profile differs
+    from the device, and otherwise not at all.
+
+    String registers are not supported.
+    """
+    def __init__(self, items):
+        if isinstance(items, dict):
+            items = list(items.items())
+        self.items = [(str(name), value) for name, value in items]
+        aNames = [name for name, _ in self.items]
+        self._addresses, self._dataTypes = ljm.namesToAddresses(len(aNames),
+                                                                aNames)
+        for name, dataType in zip(aNames, self._dataTypes):
+            if dataType not in (ljm.constants.UINT16, ljm.constants.UINT32,
+                                ljm.constants.INT32, ljm.constants.FLOAT32):
+                raise ValueError("Unsupported data type %d of register %s."
+                                 % (dataType, name))
+
+    @classmethod
+    def fromJSON(cls, jsonString):
+        """Returns a profile from a JSON object or list of [name, value]
+        pairs. Object member order and repeated names are kept.
+        """
+        items = json.loads(jsonString, object_pairs_hook=lambda pairs: pairs)
+        return cls(items)
+
+    def _unique(self):
+        """Returns the indices of the last occurrence of each register."""
+        last = {}
+        for i in range(len(self.items)):
+            last[self.items[i][0]] = i
+        return sorted(last.values())
+
+    def readCurrent(self, handle, maxBytesPerMB=None):
+        """Returns a {name: value} dictionary of the device's current
+        values of the profile's registers.
+        """
+        if maxBytesPerMB is None:
+            maxBytesPerMB = ljm.getHandleInfo(handle)[5]
+        indices = self._unique()
+        aAddresses = [self._addresses[i] for i in indices]
+        aDataTypes = [self._dataTypes[i] for i in indices]
+        aValues = []
+        for packet in _packets(aDataTypes, maxBytesPerMB, ljm.constants.READ):
+            aValues.extend(ljm.eReadAddresses(
+                handle, len(packet), [aAddresses[i] for i in packet],
+                [aDataTypes[i] for i in packet]))
+        return dict((self.items[i][0], value)
+                    for i, value in zip(indices, aValues))
+
+    def diff(self, handle, maxBytesPerMB=None):
+        """Returns the list of (name, currentValue, profileValue) of the
+        registers that differ from the profile.
+        """
+        current = self.readCurrent(handle, maxBytesPerMB)
+        changes = []
+        for i in self._unique():
+            name, value = self.items[i]
+            if not _sameValue(self._dataTypes[i], current[name], value):
+                changes.append((name, current[name], value))
+        return changes
+
+    def apply(self, handle, maxBytesPerMB=None):
+        """Writes the registers that differ from the profile.
+
+        Returns:
+            The list of (name, previousValue, newValue) changes, as
+            returned by diff.
+        """
+        if maxBytesPerMB is None:
+            maxBytesPerMB = ljm.getHandleInfo(handle)[5]
+        changes = self.diff(handle, maxBytesPerMB)
+        if not changes:
+            return changes
+
+        changed = set(name for name, _, _ in changes)
+        counts = {}
+        for name, _ in self.items:
+            counts[name] = counts.get(name, 0) + 1
+        indices = [i for i in range(len(self.items))
+                   if self.items[i][0] in changed or
+                   counts[self.items[i][0]] > 1]
+        aAddresses = [self._addresses[i] for i in indices]
+        aDataTypes = [self._dataTypes[i] for i in indices]
+        aValues = [self.items[i][1] for i in indices]
+        for packet in _packets(aDataTypes, maxBytesPerMB,
+                               ljm.constants.WRITE):
+            ljm.eWriteAddresses(handle, len(packet),
+                                [aAddresses[i] for i in packet],
+                                [aDataTypes[i] for i in packet],
+                                [aValues[i] for i in packet])
+        return changes
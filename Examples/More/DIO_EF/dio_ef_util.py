@@ -0,0 +1,224 @@
+"""
+Declarative DIO extended feature (DIO_EF) configuration and batched reads.
+
+A DIOEFConfig describes a set of clocks and DIO_EF features. apply writes
+the whole set with one eWriteAddresses call, ordered so that clocks and
+features are disabled before they are reconfigured and clocks are enabled
+last. An EFReader reads the results of many features with one
+eReadAddresses call per cycle.
+
+Example (two PWM outputs measured by two frequency inputs on a T7):
+
+    config = DIOEFConfig()
+    config.addClock(1, divisor=4, rollValue=20000)
+    config.addClock(2, divisor=4, rollValue=2000)
+    config.addFeature(pwmOut(2, clockSource=1, transition=5000))
+    config.addFeature(pwmOut(3, clockSource=2, transition=1000))
+    config.addFeature(frequencyIn(0, configA=3))
+    config.addFeature(frequencyIn(1, configA=3))
+    config.apply(handle)
+
+    reader = EFReader(handle, efResultNames([0, 1], ["READ_A_F", "READ_B_F"]))
+    periodA, freqA, periodB, freqB = reader.read()
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer:
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Multiple Value Functions (such as eWriteAddresses and eReadAddresses):
+        https://labjack.com/support/software/api/ljm/function-reference/multiple-value-functions
+    Utility Functions (such as namesToAddresses):
+        https://labjack.com/support/software/api/ljm/function-reference/utility
+
+T-Series and I/O:
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+    Extended DIO Features:
+        https://labjack.com/support/datasheets/t-series/digital-io/extended-features
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+from labjack import ljm
+
+# DIO#_EF_INDEX values.
+EF_PWM_OUT = 0
+EF_PWM_OUT_WITH_PHASE = 1
+EF_PULSE_OUT = 2
+EF_FREQUENCY_IN_RISING = 3
+EF_FREQUENCY_IN_FALLING = 4
+EF_PULSE_WIDTH_IN = 5
+EF_LINE_TO_LINE_IN = 6
+EF_HIGH_SPEED_COUNTER = 7
+EF_INTERRUPT_COUNTER = 8
+EF_INTERRUPT_COUNTER_WITH_DEBOUNCE = 9
+EF_QUADRATURE_IN = 10
+EF_INTERRUPT_FREQUENCY_IN = 11
+EF_CONDITIONAL_RESET = 12
+
+
+class DIOEFFeature(object):
+    """One DIO_EF feature. Configuration values that are None are not
+    written.
+    """
+    def __init__(self, dioNum, index, clockSource=None, configA=None,
+                 configB=None, configC=None, configD=None):
+        self.dioNum = dioNum
+        self.index = index
+        self.clockSource = clockSource
+        self.configA = configA
+        self.configB = configB
+        self.configC = configC
+        self.configD = configD
+
+    def configWrites(self):
+        """Returns the (name, value) writes that configure the feature,
+        excluding DIO#_EF_ENABLE.
+        """
+        writes = [("DIO%d_EF_INDEX" % self.dioNum, self.index)]
+        for suffix, value in (("CLOCK_SOURCE", self.clockSource),
+                              ("CONFIG_A", self.configA),
+                              ("CONFIG_B", self.configB),
+                              ("CONFIG_C", self.configC),
+                              ("CONFIG_D", self.configD)):
+            if value is not None:
+                writes.append(("DIO%d_EF_%s" % (self.dioNum, suffix), value))
+        return writes
+
+
+def pwmOut(dioNum, clockSource, transition):
+    """Returns a PWM Out feature that goes low when the clock count reaches
+    transition.
+    """
+    return DIOEFFeature(dioNum, EF_PWM_OUT, clockSource=clockSource,
+                        configA=transition)
+
+
+def frequencyIn(dioNum, configA=3, configB=None):
+    """Returns an Interrupt Frequency In feature. configA bit 0 selects
+    the rising edge and bit 1 continuous mode, configB is the number of
+    periods to average.
+    """
+    return DIOEFFeature(dioNum, EF_INTERRUPT_FREQUENCY_IN, configA=configA,
+                        configB=configB)
+
+
+def counter(dioNum, highSpeed=False):
+    """Returns an Interrupt Counter or High-Speed Counter feature."""
+    if highSpeed:
+        return DIOEFFeature(dioNum, EF_HIGH_SPEED_COUNTER)
+    return DIOEFFeature(dioNum, EF_INTERRUPT_COUNTER)
+
+
+class DIOEFConfig(object):
+    """A set of DIO_EF clocks and features that is written with one
+    eWriteAddresses call.
+    """
+    def __init__(self):
+        self._clocks = []
+        self._features = []
+
+    def addClock(self, clockNum, divisor, rollValue):
+        """Adds DIO_EF_CLOCK# (0 = 32-bit, 1 and 2 = 16-bit) with the given
+        divisor and roll value. Clock0 cannot be used together with Clock1
+        or Clock2, so the clocks it conflicts with are also disabled.
+        """
+        self._clocks.append((clockNum, divisor, rollValue))
+
+    def addFeature(self, feature):
+        """Adds a DIOEFFeature."""
+        self._features.append(feature)
+
+    def writes(self):
+        """Returns the ordered list of (name, value) writes that apply the
+        configuration.
+        """
+        clockNums = [clock[0] for clock in self._clocks]
+        disableClocks = set(clockNums)
+        if 0 in disableClocks:
+            disableClocks.update([1, 2])
+        if 1 in disableClocks or 2 in disableClocks:
+            disableClocks.add(0)
+
+        writes = []
+        # Disable everything that is reconfigured.
+        for clockNum in sorted(disableClocks):
+            writes.append(("DIO_EF_CLOCK%d_ENABLE" % clockNum, 0))
+        for feature in self._features:
+            writes.append(("DIO%d_EF_ENABLE" % feature.dioNum, 0))
+        # Configure clocks and features.
+        for clockNum, divisor, rollValue in self._clocks:
+            writes.append(("DIO_EF_CLOCK%d_DIVISOR" % clockNum, divisor))
+            writes.append(("DIO_EF_CLOCK%d_ROLL_VALUE" % clockNum, rollValue))
+        for feature in self._features:
+            writes.extend(feature.configWrites())
+        # Enable features, then the clocks that drive them.
+        for feature in self._features:
+            writes.append(("DIO%d_EF_ENABLE" % feature.dioNum, 1))
+        for clockNum in clockNums:
+            writes.append(("DIO_EF_CLOCK%d_ENABLE" % clockNum, 1))
+        return writes
+
+    def compile(self):
+        """Returns the (aAddresses, aDataTypes, aValues) lists for
+        eWriteAddresses.
+        """
+        writes = self.writes()
+        aNames = [name for name, _ in writes]
+        aAddresses, aDataTypes = ljm.namesToAddresses(len(aNames), aNames)
+        return aAddresses, aDataTypes, [value for _, value in writes]
+
+    def apply(self, handle):
+        """Writes the configuration with one eWriteAddresses call. LJM
+        splits the call into multiple packets if needed, in order.
+        """
+        aAddresses, aDataTypes, aValues = self.compile()
+        ljm.eWriteAddresses(handle, len(aAddresses), aAddresses, aDataTypes,
+                            aValues)
+
+    def disable(self, handle):
+        """Disables the configuration's features and clocks with one
+        eWriteNames call.
+        """
+        aNames = ["DIO%d_EF_ENABLE" % feature.dioNum
+                  for feature in self._features]
+        aNames += ["DIO_EF_CLOCK%d_ENABLE" % clock[0] for clock in self._clocks]
+        ljm.eWriteNames(handle, len(aNames), aNames, [0]*len(aNames))
+
+
+def efResultNames(dioNums, suffixes=("READ_A", "READ_B")):
+    """Returns the DIO#_EF_<suffix> register names of every DIO, grouped
+    by DIO.
+    """
+    return ["DIO%d_EF_%s" % (dioNum, suffix)
+            for dioNum in dioNums for suffix in suffixes]
+
+
+class EFReader(object):
+    """Reads a fixed set of registers, such as DIO_EF results, with one
+    eReadAddresses call. The register names are resolved once.
+    """
+    def __init__(self, handle, aNames):
+        self.handle = handle
+        self.names = list(aNames)
+        self._addresses, self._dataTypes = ljm.namesToAddresses(
+            len(self.names), self.names)
+
+    def read(self):
+        """Returns the list of values, in the order of names."""
+        return ljm.eReadAddresses(self.handle, len(self._addresses),
+                                  self._addresses, self._dataTypes)
+
+    def readDict(self):
+        """Returns a {name: value} dictionary of the values."""
+        return dict(zip(self.names, self.read()))
@@ -0,0 +1,201 @@
+"""
+Batched I2C transactions with bus configuration caching.
+
+Each I2CBus transaction is compiled into a single eNames call containing
+only the configuration registers that changed since the last transaction,
+the TX data, I2C_GO and the RX data read. I2CBus.transactions combines
+several transactions into one eNames call.
+
+For example, reading an SHT3x takes two calls once the bus is configured:
+
+    bus = I2CBus(handle, sdaDIONum=1, sclDIONum=0, speedThrottle=65000)
+    bus.write(0x44, [0x24, 0x00])
+    sleep(0.02)
+    aBytes = bus.read(0x44, 6)
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer:
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Multiple Value Functions (such as eNames):
+        https://labjack.com/support/software/api/ljm/function-reference/multiple-value-functions
+
+T-Series and I/O:
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+    I2C:
+        https://labjack.com/support/datasheets/t-series/digital-io/i2c
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+from labjack import ljm
+
+
+class I2CBus(object):
+    """I2C bus of one device.
+
+    The values last written to the I2C configuration registers are
+    cached, and a transaction only writes the registers whose value
+    differs. If another program or script may change the I2C registers,
+    or the device was power cycled, call invalidate before the next
+    transaction.
+
+    Options bits:
+        bit0: Reset the I2C bus.
+        bit1: Restart w/o stop.
+        bit2: Disable clock stretching.
+    """
+    def __init__(self, handle, sdaDIONum, sclDIONum, speedThrottle=0,
+                 options=0):
+        self.handle = handle
+        self._config = {"I2C_SDA_DIONUM": sdaDIONum,
+                        "I2C_SCL_DIONUM": sclDIONum,
+                        "I2C_SPEED_THROTTLE": speedThrottle,
+                        "I2C_OPTIONS": options}
+        self._written = {}
+
+    def configure(self, sdaDIONum=None, sclDIONum=None, speedThrottle=None,
+                  options=None):
+        """Changes the bus configuration used by the next transaction."""
+        for name, value in (("I2C_SDA_DIONUM", sdaDIONum),
+                            ("I2C_SCL_DIONUM", sclDIONum),
+                            ("I2C_SPEED_THROTTLE", speedThrottle),
+                            ("I2C_OPTIONS", options)):
+            if value is not None:
+                self._config[name] = value
+
+    def invalidate(self):
+        """Forgets the cached register values so that the next transaction
+        writes the full configuration.
+        """
+        self._written = {}
+
+    def _compile(self, transactions):
+        """Returns the eNames lists for the given transactions, the values
+        each transaction writes to the configuration registers, and each
+        transaction's (RX offset, RX length) in the returned values.
+        """
+        aNames = []
+        aWrites = []
+        aNumValues = []
+        aValues = []
+        rxSlices = []
+        written = dict(self._written)
+
+        def addWrite(name, values):
+            aNames.append(name)
+            aWrites.append(ljm.constants.WRITE)
+            aNumValues.append(len(values))
+            aValues.extend(values)
+
+        for slaveAddress, aTXBytes, numRX in transactions:
+            settings = [(name, self._config[name])
+                        for name in sorted(self._config)]
+            settings += [("I2C_SLAVE_ADDRESS", slaveAddress),
+                         ("I2C_NUM_BYTES_TX", len(aTXBytes)),
+                         ("I2C_NUM_BYTES_RX", numRX)]
+            for name, value in settings:
+                if written.get(name) != value:
+                    addWrite(name, [value])
+                    written[name] = value
+            if aTXBytes:
+                addWrite("I2C_DATA_TX", list(aTXBytes))
+            addWrite("I2C_GO", [1])
+            if numRX > 0:
+                aNames.append("I2C_DATA_RX")
+                aWrites.append(ljm.constants.READ)
+                aNumValues.append(numRX)
+                rxSlices.append((len(aValues), numRX))
+                aValues.extend([0]*numRX)
+            else:
+                rxSlices.append((len(aValues), 0))
+
+        return aNames, aWrites, aNumValues, aValues, written, rxSlices
+
+    def transactions(self, transactions):
+        """Performs several I2C transactions with one eNames call.
+
+        Args:
+            transactions: A list of (slaveAddress, aTXBytes, numRX)
+                tuples, performed in order.
+
+        Returns:
+            A list with the list of received bytes of each transaction.
+
+        Note:
+            LJM splits the call into multiple packets if it does not fit
+            in one. Transactions that need a delay between them, such as a
+            sensor conversion time, should not be combined.
+        """
+        if not transactions:
+            return []
+        aNames, aWrites, aNumValues, aValues, written, rxSlices = \
+            self._compile(transactions)
+        try:
+            results = ljm.eNames(self.handle, len(aNames), aNames, aWrites,
+                                 aNumValues, aValues)
+        except ljm.LJMError:
+            # It is unknown which frames were performed.
+            self.invalidate()
+            raise
+        self._written = written
+        return [[int(x) for x in results[offset:offset + numRX]]
+                for offset, numRX in rxSlices]
+
+    def transaction(self, slaveAddress, aTXBytes=(), numRX=0):
+        """Transmits aTXBytes to, then receives numRX bytes from the slave
+        in one I2C transaction, and returns the list of received bytes.
+        """
+        return self.transactions([(slaveAddress, aTXBytes, numRX)])[0]
+
+    def write(self, slaveAddress, aTXBytes):
+        """Transmits aTXBytes to the slave."""
+        self.transaction(slaveAddress, aTXBytes, 0)
+
+    def read(self, slaveAddress, numRX):
+        """Returns a list of numRX bytes received from the slave."""
+        return self.transaction(slaveAddress, (), numRX)
+
+
+class I2CTransactionQueue(object):
+    """Collects I2C transactions to perform them with minimal round trips.
+
+    Example:
+        queue = I2CTransactionQueue(bus)
+        tempIndex = queue.add(0x48, [0x00], 2)
+        humidityIndex = queue.add(0x40, [0xE5], 2)
+        results = queue.execute()
+        aTempBytes = results[tempIndex]
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self._transactions = []
+
+    def add(self, slaveAddress, aTXBytes=(), numRX=0):
+        """Queues a transaction and returns its index in the results of
+        execute.
+        """
+        self._transactions.append((slaveAddress, list(aTXBytes), numRX))
+        return len(self._transactions) - 1
+
+    def __len__(self):
+        return len(self._transactions)
+
+    def execute(self):
+        """Performs and clears the queued transactions, returning the list
+        of received bytes of each one.
+        """
+        transactions = self._transactions
+        self._transactions = []
+        return self.bus.transactions(transactions)
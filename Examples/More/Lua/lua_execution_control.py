@@ -35,6 +35,7 @@ Note:
 from time import sleep
 
 from labjack import ljm
+import lua_util
 
 
 def loadLuaScript(handle, luaScript):
@@ -45,14 +46,10 @@ def loadLuaScript(handle, luaScript):
         scriptLen = len(luaScript)
         print("\nScript length: %u\n" % scriptLen)
 
-        # LUA_RUN must be written to twice to disable any running scripts.
-        ljm.eWriteName(handle, "LUA_RUN", 0)
-
-        # Then, wait for the Lua VM to shut down. Some T7 firmware
-        # versions need a longer time to shut down than others.
-        sleep(0.6)
-
-        ljm.eWriteName(handle, "LUA_RUN", 0)
+        # Disable any running script and wait for the Lua VM to shut down.
+        # See lua_util.py for a deployment manager that skips uploading
+        # scripts that are already running.
+        lua_util.stopLuaScript(handle)
         ljm.eWriteName(handle, "LUA_SOURCE_SIZE", scriptLen)
         ljm.eWriteNameByteArray(handle, "LUA_SOURCE_WRITE", scriptLen, luaScript)
         ljm.eWriteName(handle, "LUA_DEBUG_ENABLE", 1)
@@ -89,7 +86,7 @@ def readLuaInfo(handle):
                 continue
             print("LUA_DEBUG_NUM_BYTES: %d\n" % numBytes)
             aBytes = ljm.eReadNameByteArray(handle, "LUA_DEBUG_DATA", int(numBytes))
-            luaMessage = "".join([("%c" % val) for val in aBytes])
+            luaMessage = bytes(bytearray(aBytes)).decode("ascii", "replace")
             print("LUA_DEBUG_DATA: %s" % luaMessage)
     except ljm.LJMError:
         print("Error while running the main loop")
@@ -0,0 +1,236 @@
+"""
+Utilities for deploying and monitoring Lua scripts on T-series devices.
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer:
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Multiple Value Functions (such as eNames and eWriteNameByteArray):
+        https://labjack.com/support/software/api/ljm/function-reference/multiple-value-functions
+
+T-Series and I/O:
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+    Lua Scripting:
+        https://labjack.com/support/datasheets/t-series/lua-scripting
+    User-RAM:
+        https://labjack.com/support/datasheets/t-series/lua-scripting
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+import threading
+import zlib
+from time import sleep
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
+
+from labjack import ljm
+
+
+def stopLuaScript(handle, timeout=5.0, pollInterval=0.01):
+    """Stops any running Lua script and waits for the Lua VM to shut down.
+
+    LUA_RUN is polled until it reads 0 instead of sleeping for a fixed
+    time, since some T7 firmware versions need longer to shut down than
+    others.
+
+    Raises:
+        LJMError: The script did not stop within timeout seconds.
+    """
+    ljm.eWriteName(handle, "LUA_RUN", 0)
+    deadline = ljm.getHostTick() + int(timeout*1000000)
+    while ljm.eReadName(handle, "LUA_RUN") != 0:
+        if ljm.getHostTick() > deadline:
+            raise ljm.LJMError(errorString="Timed out waiting for the Lua "
+                               "script to stop.")
+        sleep(pollInterval)
+
+    # LUA_RUN must be written to twice to disable any running scripts.
+    ljm.eWriteName(handle, "LUA_RUN", 0)
+
+
+def _toScriptBytes(luaScript):
+    """Returns the Lua script as a bytearray."""
+    if isinstance(luaScript, str):
+        return bytearray(luaScript, "ascii")
+    return bytearray(luaScript)
+
+
+class LuaScriptDeployer(object):
+    """Deploys Lua scripts, skipping devices that already run the script.
+
+    A CRC-32 of the script source is written to hashRegister after the
+    script is started. Before uploading, LUA_RUN and hashRegister are
+    read in one eReadNames call; if the script is running and the hash
+    matches, the upload is skipped.
+
+    hashRegister must be a UINT32 register that the script itself does
+    not use. User RAM is cleared on power-up, which forces a redeploy of
+    scripts that were not started by LUA_RUN_DEFAULT.
+    """
+    def __init__(self, hashRegister="USER_RAM39_U32", stopTimeout=5.0,
+                 debugEnable=True):
+        self.hashRegister = hashRegister
+        self.stopTimeout = stopTimeout
+        self.debugEnable = debugEnable
+
+    @staticmethod
+    def scriptHash(luaScript):
+        """Returns the 32-bit hash stored for the given script."""
+        return zlib.crc32(bytes(_toScriptBytes(luaScript))) & 0xFFFFFFFF
+
+    def isDeployed(self, handle, luaScript):
+        """Returns True if the given script is running on the device."""
+        luaRun, storedHash = ljm.eReadNames(handle, 2, ["LUA_RUN",
+                                                        self.hashRegister])
+        return luaRun == 1 and int(storedHash) == self.scriptHash(luaScript)
+
+    def deploy(self, handle, luaScript, force=False):
+        """Uploads and starts the script unless it is already running.
+
+        Returns:
+            True if the script was uploaded, False if it was skipped.
+        """
+        if not force and self.isDeployed(handle, luaScript):
+            return False
+
+        scriptBytes = _toScriptBytes(luaScript)
+        scriptLen = len(scriptBytes)
+        debug = 1 if self.debugEnable else 0
+
+        stopLuaScript(handle, self.stopTimeout)
+        ljm.eWriteName(handle, "LUA_SOURCE_SIZE", scriptLen)
+        ljm.eWriteNameByteArray(handle, "LUA_SOURCE_WRITE", scriptLen,
+                                scriptBytes)
+        aNames = ["LUA_DEBUG_ENABLE", "LUA_DEBUG_ENABLE_DEFAULT", "LUA_RUN",
+                  self.hashRegister]
+        aValues = [debug, debug, 1, self.scriptHash(scriptBytes)]
+        ljm.eWriteNames(handle, len(aNames), aNames, aValues)
+        return True
+
+    def deployMany(self, handles, luaScript, force=False, maxWorkers=8):
+        """Deploys the script to every handle in parallel, from at most
+        maxWorkers threads.
+
+        Returns:
+            A {handle: result} dictionary where result is the return value
+            of deploy, or the exception raised while deploying to that
+            device.
+        """
+        return ljm.forEachHandle(
+            handles, lambda handle: self.deploy(handle, luaScript, force),
+            maxWorkers)
+
+
+def _decodeDebugBytes(aValues):
+    """Returns the text of LUA_DEBUG_DATA byte values read by eNames."""
+    return bytes(bytearray(int(v) for v in aValues)).decode("ascii", "replace")
+
+
+class LuaDebugTail(object):
+    """Background reader of a device's Lua debug output.
+
+    A thread polls LUA_DEBUG_NUM_BYTES and delivers complete lines of
+    LUA_DEBUG_DATA to callback(handle, line), or to lineQueue as
+    (handle, line) tuples if no callback is given. If neither is given, a
+    queue is created and available as the lines attribute.
+
+    Once bytes are known to be waiting, each poll is a single eNames call
+    that reads them from LUA_DEBUG_DATA and reads the next
+    LUA_DEBUG_NUM_BYTES, so a busy script costs one round trip per
+    chunk. The poll interval halves down to minInterval while data
+    arrives and doubles up to maxInterval while the script is quiet.
+
+    Tails for different handles run in their own threads and may be used
+    concurrently, optionally sharing one lineQueue.
+    """
+    def __init__(self, handle, callback=None, lineQueue=None,
+                 minInterval=0.01, maxInterval=1.0):
+        self.handle = handle
+        self.callback = callback
+        if callback is None and lineQueue is None:
+            lineQueue = queue.Queue()
+        self.lines = lineQueue
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.error = None
+        self._partial = ""
+        self._stopEvent = threading.Event()
+        self._thread = None
+
+        # Read at most one packet's worth of debug data per transaction,
+        # leaving room for the Feedback header and LUA_DEBUG_NUM_BYTES.
+        maxBytesPerMB = ljm.getHandleInfo(handle)[5]
+        self._maxChunk = max(maxBytesPerMB - 16, 32)
+
+    def start(self):
+        """Starts the polling thread."""
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stops the polling thread and delivers any unterminated line."""
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._partial:
+            self._deliver(self._partial)
+            self._partial = ""
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _deliver(self, line):
+        if self.callback is not None:
+            self.callback(self.handle, line)
+        else:
+            self.lines.put((self.handle, line))
+
+    def _feed(self, text):
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._deliver(line.rstrip("\r"))
+
+    def _run(self):
+        interval = self.maxInterval
+        try:
+            numBytes = int(ljm.eReadName(self.handle, "LUA_DEBUG_NUM_BYTES"))
+            while not self._stopEvent.is_set():
+                if numBytes > 0:
+                    chunk = min(numBytes, self._maxChunk)
+                    results = ljm.eNames(
+                        self.handle, 2,
+                        ["LUA_DEBUG_DATA", "LUA_DEBUG_NUM_BYTES"],
+                        [ljm.constants.READ, ljm.constants.READ],
+                        [chunk, 1], [0]*(chunk + 1))
+                    self._feed(_decodeDebugBytes(results[:chunk]))
+                    numBytes = int(results[chunk])
+                    interval = max(interval/2.0, self.minInterval)
+                    if numBytes > 0:
+                        # More data is already waiting.
+                        continue
+                else:
+                    interval = min(interval*2.0, self.maxInterval)
+                self._stopEvent.wait(interval)
+                if numBytes == 0:
+                    numBytes = int(ljm.eReadName(self.handle,
+                                                 "LUA_DEBUG_NUM_BYTES"))
+        except Exception as excep:
+            self.error = excep
@@ -33,11 +33,22 @@ Note:
     Python standard documentation.
 """
 import os
+import posixpath
+from collections import namedtuple
 
 from labjack import ljm
 
 QUIET_OPEN = True
 
+# Device error codes returned by the FILE_IO_DIR_FIRST/FILE_IO_DIR_NEXT
+# iterator when there are no more directory entries.
+FILE_IO_NOT_FOUND = 2960
+FILE_IO_INVALID_OBJECT = 2809
+
+# FILE_IO_ATTRIBUTES bits.
+ATTR_DIRECTORY = 1 << 4
+ATTR_ARCHIVE = 1 << 5
+
 
 def sanitizePath(path):
     """Return the path null-terminator guaranteed to be appended to the end.
@@ -113,46 +124,60 @@ def goToPath(handle, sdPath):
     ljm.eWriteName(handle, "FILE_IO_DIR_CHANGE", 1)
 
 
-def getCurDirContents(handle):
-    """Return the current working directory's contents as an iterable.
-    """
-    # 1) Write a value of 1 to FILE_IO_DIR_FIRST. The error returned indicates
-    #    whether anything was found. No error (0) indicates that something was
-    #    found. FILE_IO_NOT_FOUND (2960) indicates that nothing was found.
-    ljm.eWriteName(handle, "FILE_IO_DIR_FIRST", 1)
+def _readCurDirEntries(handle):
+    """Return the current working directory's entries as a list of
+    (rawName, size, attributes) tuples.
 
-    # Loop reading name and properties of one file per iteration
-    more_files = True
-    dirContents = {}
-    while more_files:
-        # 2) Read FILE_IO_PATH_READ_LEN_BYTES, FILE_IO_ATTRIBUTES, and
-        #    FILE_IO_SIZE_BYTES
-        len_file_name_as_bytes = int(
-            ljm.eReadName(handle, "FILE_IO_PATH_READ_LEN_BYTES")
-        )
-        size = (int(ljm.eReadName(handle, "FILE_IO_SIZE_BYTES")))
-        attr = (int(ljm.eReadName(handle, "FILE_IO_ATTRIBUTES")))
-
-        # 3) Read an array of size FILE_IO_PATH_READ_LEN_BYTES from
+    Each entry costs two round trips: one eNames call that advances the
+    directory iterator and reads FILE_IO_PATH_READ_LEN_BYTES,
+    FILE_IO_SIZE_BYTES and FILE_IO_ATTRIBUTES together, and one
+    FILE_IO_PATH_READ byte array read for the name.
+    """
+    aNames = ["FILE_IO_DIR_FIRST",
+              "FILE_IO_PATH_READ_LEN_BYTES",
+              "FILE_IO_SIZE_BYTES",
+              "FILE_IO_ATTRIBUTES"]
+    aWrites = [ljm.constants.WRITE, ljm.constants.READ, ljm.constants.READ,
+               ljm.constants.READ]
+    aNumValues = [1, 1, 1, 1]
+    aValues = [1, 0, 0, 0]
+
+    entries = []
+    while True:
+        # 1) Write a value of 1 to FILE_IO_DIR_FIRST (first entry) or
+        #    FILE_IO_DIR_NEXT (later entries) and read the entry's name
+        #    length, size and attributes in the same transaction. An error
+        #    from the iterator write indicates that there are no more
+        #    entries: FILE_IO_NOT_FOUND (2960) or FILE_IO_INVALID_OBJECT
+        #    (2809).
+        try:
+            results = ljm.eNames(handle, len(aNames), aNames, aWrites,
+                                 aNumValues, aValues)
+        except ljm.LJMError as excep:
+            if excep.errorCode in (FILE_IO_NOT_FOUND, FILE_IO_INVALID_OBJECT):
+                break
+            raise
+        nameLen = int(results[1])
+        size = int(results[2])
+        attr = int(results[3])
+
+        # 2) Read an array of size FILE_IO_PATH_READ_LEN_BYTES from
         #    FILE_IO_PATH_READ.
-        file_name_as_bytes = ljm.eReadNameByteArray(handle, "FILE_IO_PATH_READ",
-                                                    len_file_name_as_bytes)
+        nameBytes = ljm.eReadNameByteArray(handle, "FILE_IO_PATH_READ",
+                                           nameLen)
+        entries.append(("".join(chr(x) for x in nameBytes), size, attr))
 
-        # convert to string
-        file_name_as_strings = "".join(chr(x) for x in file_name_as_bytes)
+        aNames[0] = "FILE_IO_DIR_NEXT"
 
-        dirContents[file_name_as_strings] = (size, attr)
+    return entries
 
-        # 4) Write a value of 1 to FILE_IO_DIR_NEXT. The error returned
-        #    indicates whether anything was found. No error (0) indicates that
-        #    there are more items->go back to step 2. FILE_IO_INVALID_OBJECT
-        #    (2809) and potentially error code FILE_IO_NOT_FOUND (2960)
-        #    indicates that there are no more items->Done.
-        try:
-            ljm.eWriteName(handle, "FILE_IO_DIR_NEXT", 1)
-        except:
-            more_files = False
 
+def getCurDirContents(handle):
+    """Return the current working directory's contents as an iterable.
+    """
+    dirContents = {}
+    for name, size, attr in _readCurDirEntries(handle):
+        dirContents[name] = (size, attr)
     return dirContents
 
 
@@ -285,6 +310,171 @@ def deleteFile(handle, sdPath):
     print("Successfully deleted file.")
 
 
+class SDStat(namedtuple("SDStat", ["path", "size", "attributes"])):
+    """SD card path information returned by SDFileSystem.stat."""
+    __slots__ = ()
+
+    @property
+    def isDir(self):
+        return bool(self.attributes & ATTR_DIRECTORY)
+
+    @property
+    def isFile(self):
+        return not self.attributes & ATTR_DIRECTORY
+
+
+class SDFileSystem(object):
+    """Cached view of a device's SD card file system.
+
+    Directory listings are read with _readCurDirEntries and cached by
+    absolute path, so repeated listdir/stat/walk calls on an unchanged
+    card cost no device communication. The cache for a directory is
+    invalidated by deleteFile and can be dropped manually with
+    invalidate, for example after another program wrote to the card.
+
+    Relative paths are relative to the device's working directory when
+    the object first accessed the card. The device's working directory is
+    tracked so that it is only changed when needed; use restoreCWD to
+    change it back afterwards.
+    """
+    def __init__(self, handle):
+        self.handle = handle
+        self._listings = {}
+        self._startCWD = None
+        self._cwd = None
+
+    def _getStartCWD(self):
+        if self._startCWD is None:
+            self._startCWD = getCWD(self.handle).split("\x00", 1)[0] or "/"
+            self._cwd = self._startCWD
+        return self._startCWD
+
+    def _absPath(self, path):
+        path = path.split("\x00", 1)[0]
+        if not posixpath.isabs(path):
+            path = posixpath.join(self._getStartCWD(), path)
+        return posixpath.normpath(path).replace("//", "/")
+
+    def _chdir(self, absPath):
+        self._getStartCWD()
+        if absPath != self._cwd:
+            goToPath(self.handle, absPath)
+            self._cwd = absPath
+
+    def _entries(self, absPath):
+        """Returns the {name: (size, attributes)} listing of absPath."""
+        listing = self._listings.get(absPath)
+        if listing is None:
+            self._chdir(absPath)
+            listing = {}
+            for rawName, size, attr in _readCurDirEntries(self.handle):
+                name = rawName.split("\x00", 1)[0]
+                if name not in (".", ".."):
+                    listing[name] = (size, attr)
+            self._listings[absPath] = listing
+        return listing
+
+    def listdir(self, path="."):
+        """Returns a list of the names in the given directory."""
+        return sorted(self._entries(self._absPath(path)))
+
+    def scandir(self, path="."):
+        """Returns a list of SDStats for the entries of the given
+        directory, sorted by name.
+        """
+        absPath = self._absPath(path)
+        listing = self._entries(absPath)
+        return [SDStat(posixpath.join(absPath, name), listing[name][0],
+                       listing[name][1])
+                for name in sorted(listing)]
+
+    def stat(self, path):
+        """Returns an SDStat for the given path.
+
+        Raises:
+            ValueError: The path does not exist.
+        """
+        absPath = self._absPath(path)
+        if absPath == "/":
+            return SDStat(absPath, 0, ATTR_DIRECTORY)
+        parent, name = posixpath.split(absPath)
+        try:
+            size, attr = self._entries(parent)[name]
+        except KeyError:
+            raise ValueError("File not found: %s" % absPath)
+        return SDStat(absPath, size, attr)
+
+    def walk(self, top="/"):
+        """Generates (dirPath, dirNames, fileNames) tuples for the
+        directory tree rooted at top, like os.walk in top-down order.
+        """
+        topPath = self._absPath(top)
+        pending = [topPath]
+        while pending:
+            dirPath = pending.pop()
+            listing = self._entries(dirPath)
+            dirNames = []
+            fileNames = []
+            for name in sorted(listing):
+                if listing[name][1] & ATTR_DIRECTORY:
+                    dirNames.append(name)
+                else:
+                    fileNames.append(name)
+            yield dirPath, dirNames, fileNames
+            # Modifying dirNames in place prunes the walk, as with os.walk.
+            for name in reversed(dirNames):
+                pending.append(posixpath.join(dirPath, name))
+
+    def deleteFile(self, path):
+        """Removes the specified file and invalidates its directory's
+        cached listing.
+        """
+        absPath = self._absPath(path)
+        try:
+            deleteFile(self.handle, absPath)
+        finally:
+            self.invalidate(posixpath.dirname(absPath))
+
+    def invalidate(self, path=None):
+        """Drops the cached listing of path, or of every directory if path
+        is None.
+        """
+        if path is None:
+            self._listings.clear()
+        else:
+            self._listings.pop(self._absPath(path), None)
+
+    def restoreCWD(self):
+        """Changes the device's working directory back to the one that was
+        current when this object first accessed the card.
+        """
+        if self._startCWD is not None:
+            self._chdir(self._startCWD)
+
+
+def inventorySDCards(handles, top="/", maxWorkers=8):
+    """Walks the SD card of every handle in parallel, from at most
+    maxWorkers threads, and returns a {handle: result} dictionary.
+
+    Each result is a list of (path, size, attributes) tuples for every
+    file and directory below top, or the exception raised while walking
+    that device's card. ljm calls on different handles may run
+    concurrently, so with enough workers the total time is close to that
+    of the slowest card.
+    """
+    def inventory(handle):
+        sdfs = SDFileSystem(handle)
+        items = []
+        try:
+            for dirPath, _, _ in sdfs.walk(top):
+                items.extend(tuple(entry) for entry in sdfs.scandir(dirPath))
+        finally:
+            sdfs.restoreCWD()
+        return items
+
+    return ljm.forEachHandle(handles, inventory, maxWorkers)
+
+
 def exampleProgram():
     handle = openDevice(quiet=False)
     printDiskInfo(handle)
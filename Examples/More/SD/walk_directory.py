@@ -0,0 +1,25 @@
+import sys
+from labjack import ljm
+import sd_util
+
+
+def usage():
+    print('Usage: %s [directory]' % (sys.argv[0]))
+    exit()
+
+
+if len(sys.argv) > 2:
+    usage()
+
+top = "/"
+if len(sys.argv) == 2:
+    top = sys.argv[1]
+
+handle = sd_util.openDevice()
+sdfs = sd_util.SDFileSystem(handle)
+for dirPath, dirNames, fileNames in sdfs.walk(top):
+    print(dirPath)
+    for name in fileNames:
+        print("    %-40s %9d bytes" % (name, sdfs.stat(dirPath + "/" + name).size))
+sdfs.restoreCWD()
+ljm.close(handle)
@@ -0,0 +1,211 @@
+"""
+Batched SPI transfers with bus configuration caching.
+
+Each SPIBus transfer is packed into a single eAddresses call containing
+only the configuration registers that changed since the last transfer,
+the TX data, SPI_GO and the RX data read. SPIBus.transferMany packs as many
+transfers per eAddresses call as fit in the connection's maximum packet
+size.
+
+Example:
+
+    bus = SPIBus(handle, csDIONum=1, clkDIONum=0, misoDIONum=3,
+                 mosiDIONum=2, mode=3)
+    aRXBytes = bus.transfer([0x01, 0x80, 0x00])
+    aReadings = bus.transferMany([[0x01, 0x80 | (ch << 4), 0x00]
+                                  for ch in range(8)])
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer:
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Multiple Value Functions (such as eAddresses):
+        https://labjack.com/support/software/api/ljm/function-reference/multiple-value-functions
+
+T-Series and I/O:
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+    SPI:
+        https://labjack.com/support/datasheets/t-series/digital-io/spi
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+from labjack import ljm
+from labjack.ljm import packing
+
+# Configuration registers in the order they are written.
+_CONFIG_NAMES = ["SPI_CS_DIONUM", "SPI_CLK_DIONUM", "SPI_MISO_DIONUM",
+                 "SPI_MOSI_DIONUM", "SPI_MODE", "SPI_SPEED_THROTTLE",
+                 "SPI_OPTIONS"]
+_REGISTER_NAMES = _CONFIG_NAMES + ["SPI_NUM_BYTES", "SPI_DATA_TX", "SPI_GO",
+                                   "SPI_DATA_RX"]
+
+_g_registers = {}
+
+
+def _register(name):
+    """Returns the cached (address, dataType) of a register name."""
+    if not _g_registers:
+        aAddresses, aDataTypes = ljm.namesToAddresses(len(_REGISTER_NAMES),
+                                                      _REGISTER_NAMES)
+        for i in range(len(_REGISTER_NAMES)):
+            dataType = aDataTypes[i]
+            if _REGISTER_NAMES[i] in ("SPI_DATA_TX", "SPI_DATA_RX"):
+                dataType = ljm.constants.BYTE
+            _g_registers[_REGISTER_NAMES[i]] = (aAddresses[i], dataType)
+    return _g_registers[name]
+
+
+class SPIBus(object):
+    """SPI bus of one device.
+
+    The values last written to the SPI configuration registers are
+    cached, and a transfer only writes the registers whose value differs.
+    If another program or script may change the SPI registers, or the
+    device was power cycled, call invalidate before the next transfer.
+
+    Mode: CPHA is bit 0, CPOL is bit 1.
+    Speed throttle: 1 to 65536 where 0 = 65536 (~800 kHz, maximum).
+    Options:
+        bit 0: 1 = Active low clock select disabled.
+        bit 1: 1 = DIO directions are not automatically changed.
+        bits 4-7: Number of bits in the last byte. 0 = 8.
+    """
+    def __init__(self, handle, csDIONum, clkDIONum, misoDIONum, mosiDIONum,
+                 mode=0, speedThrottle=0, options=0):
+        self.handle = handle
+        self._config = {}
+        self.configure(csDIONum, clkDIONum, misoDIONum, mosiDIONum, mode,
+                       speedThrottle, options)
+        self._written = {}
+        self.maxBytesPerMB = ljm.getHandleInfo(handle)[5]
+
+    def configure(self, csDIONum=None, clkDIONum=None, misoDIONum=None,
+                  mosiDIONum=None, mode=None, speedThrottle=None,
+                  options=None):
+        """Changes the bus configuration used by the next transfer."""
+        values = [csDIONum, clkDIONum, misoDIONum, mosiDIONum, mode,
+                  speedThrottle, options]
+        for name, value in zip(_CONFIG_NAMES, values):
+            if value is not None:
+                self._config[name] = value
+
+    def invalidate(self):
+        """Forgets the cached register values so that the next transfer
+        writes the full configuration.
+        """
+        self._written = {}
+
+    def _frames(self, aTXBytes, written):
+        """Returns the (name, direction, values) frames of one transfer and
+        updates written with the configuration it writes.
+        """
+        frames = []
+        settings = [(name, self._config[name]) for name in _CONFIG_NAMES]
+        settings.append(("SPI_NUM_BYTES", len(aTXBytes)))
+        for name, value in settings:
+            if written.get(name) != value:
+                frames.append((name, ljm.constants.WRITE, [value]))
+                written[name] = value
+        frames.append(("SPI_DATA_TX", ljm.constants.WRITE, list(aTXBytes)))
+        frames.append(("SPI_GO", ljm.constants.WRITE, [1]))
+        frames.append(("SPI_DATA_RX", ljm.constants.READ,
+                       [0]*len(aTXBytes)))
+        return frames
+
+    def _packetSizes(self, frames):
+        """Returns the (command, response) Feedback sizes of frames (see
+        labjack.ljm.packing.frameSizes).
+        """
+        commandSize = 0
+        responseSize = 0
+        for name, direction, values in frames:
+            command, response = packing.frameSizes(_register(name)[1],
+                                                   direction, len(values))
+            commandSize += command
+            responseSize += response
+        return commandSize, responseSize
+
+    def _execute(self, frames):
+        """Performs frames with one eAddresses call and returns the RX
+        bytes of each transfer in frames.
+        """
+        aAddresses = []
+        aDataTypes = []
+        aWrites = []
+        aNumValues = []
+        aValues = []
+        rxSlices = []
+        for name, direction, values in frames:
+            address, dataType = _register(name)
+            if name == "SPI_DATA_RX":
+                rxSlices.append((len(aValues), len(values)))
+            aAddresses.append(address)
+            aDataTypes.append(dataType)
+            aWrites.append(direction)
+            aNumValues.append(len(values))
+            aValues.extend(values)
+        results = ljm.eAddresses(self.handle, len(aAddresses), aAddresses,
+                                 aDataTypes, aWrites, aNumValues, aValues)
+        return [[int(x) for x in results[offset:offset + numBytes]]
+                for offset, numBytes in rxSlices]
+
+    def transferMany(self, aTransfers):
+        """Performs several SPI transfers with as few eAddresses calls as
+        possible.
+
+        Transfers are packed in order into calls whose Feedback command
+        and response each fit in the connection's maxBytesPerMB.
+
+        Args:
+            aTransfers: A list of TX byte lists. Each transfer receives as
+                many bytes as it transmits.
+
+        Returns:
+            A list with the list of received bytes of each transfer.
+        """
+        results = []
+        written = dict(self._written)
+        batch = []
+        commandSize = packing.MBFB_HEADER_SIZE
+        responseSize = packing.MBFB_HEADER_SIZE
+        try:
+            for aTXBytes in aTransfers:
+                writtenBefore = dict(written)
+                frames = self._frames(aTXBytes, written)
+                frameCommand, frameResponse = self._packetSizes(frames)
+                if batch and (commandSize + frameCommand > self.maxBytesPerMB or
+                              responseSize + frameResponse > self.maxBytesPerMB):
+                    results.extend(self._execute(batch))
+                    self._written = writtenBefore
+                    batch = []
+                    commandSize = packing.MBFB_HEADER_SIZE
+                    responseSize = packing.MBFB_HEADER_SIZE
+                batch.extend(frames)
+                commandSize += frameCommand
+                responseSize += frameResponse
+            if batch:
+                results.extend(self._execute(batch))
+                self._written = written
+        except ljm.LJMError:
+            # It is unknown which frames were performed.
+            self.invalidate()
+            raise
+        return results
+
+    def transfer(self, aTXBytes):
+        """Transmits aTXBytes while receiving the same number of bytes, and
+        returns the list of received bytes.
+        """
+        return self.transferMany([aTXBytes])[0]
@@ -0,0 +1,125 @@
+"""
+Demonstrates how to stream using a data callback. The library reads the
+stream data into a reused buffer and passes it to the callback, so the
+callback does not call eStreamRead.
+
+Relevant Documentation:
+
+LJM Library:
+    LJM Library Installer:
+        https://labjack.com/support/software/installers/ljm
+    LJM Users Guide:
+        https://labjack.com/support/software/api/ljm
+    Opening and Closing:
+        https://labjack.com/support/software/api/ljm/function-reference/opening-and-closing
+    Utility Functions (such as NamesToAddresses):
+        https://labjack.com/support/software/api/ljm/function-reference/utility
+    Stream Functions:
+        https://labjack.com/support/software/api/ljm/function-reference/stream-functions
+
+T-Series and I/O:
+    Modbus Map:
+        https://labjack.com/support/software/api/modbus/modbus-map
+    Stream Mode:
+        https://labjack.com/support/datasheets/t-series/communication/stream-mode
+    Analog Inputs:
+        https://labjack.com/support/datasheets/t-series/ain
+
+Note:
+    Our Python interfaces throw exceptions when there are any issues with
+    device communications that need addressed. Many of our examples will
+    terminate immediately when an exception is thrown. The onus is on the API
+    user to address the cause of any exceptions thrown, and add exception
+    handling when appropriate. We create our own exception classes that are
+    derived from the built-in Python Exception class and can be caught as such.
+    For more information, see the implementation in our source code and the
+    Python standard documentation.
+"""
+import sys
+import threading
+import time
+
+from labjack import ljm
+
+
+aScanListNames = ["AIN0", "AIN1"]  # Scan list names to stream
+numAddresses = len(aScanListNames)
+scanRate = 2000
+scansPerRead = int(scanRate / 2)
+numberOfReadsToPerform = 10
+
+printLock = threading.Lock()
+numReads = 0
+
+
+# Called by LJM's stream thread with the data already read. aData is reused
+# for the next read, so copy any values that need to be kept.
+def myStreamDataCallback(handle, aData, deviceScanBacklog, ljmScanBacklog,
+                         error):
+    global numReads
+
+    if error is not None:
+        if error.errorCode == ljm.errorcodes.STREAM_NOT_RUNNING:
+            return
+        with printLock:
+            print(error)
+        return
+
+    numReads += 1
+    scans = len(aData) // numAddresses
+    string = "\niteration: %3d\n  1st scan out of %i: " % (numReads, scans)
+    for j in range(numAddresses):
+        string += "%s = %0.5f, " % (aScanListNames[j], aData[j])
+    string += "\n  Scan Backlogs: Device = %i, LJM = %i" % \
+        (deviceScanBacklog, ljmScanBacklog)
+    with printLock:
+        print(string)
+
+
+if __name__ == "__main__":
+    # Open first found LabJack
+    handle = ljm.openS("ANY", "ANY", "ANY")  # Any device, Any connection, Any identifier
+    #handle = ljm.openS("T8", "ANY", "ANY")  # T8 device, Any connection, Any identifier
+    #handle = ljm.openS("T7", "ANY", "ANY")  # T7 device, Any connection, Any identifier
+    #handle = ljm.openS("T4", "ANY", "ANY")  # T4 device, Any connection, Any identifier
+    #handle = ljm.open(ljm.constants.dtANY, ljm.constants.ctANY, "ANY")  # Any device, Any connection, Any identifier
+
+    info = ljm.getHandleInfo(handle)
+    print("Opened a LabJack with Device type: %i, Connection type: %i,\n"
+          "Serial number: %i, IP address: %s, Port: %i,\nMax bytes per MB: %i" %
+          (info[0], info[1], info[2], ljm.numberToIP(info[3]), info[4], info[5]))
+
+    aScanList = ljm.namesToAddresses(numAddresses, aScanListNames)[0]
+
+    try:
+        # Ensure triggered stream is disabled and internally-clocked stream
+        # is used. The T4 does not have these registers.
+        if info[0] != ljm.constants.dtT4:
+            ljm.eWriteNames(handle, 2,
+                            ["STREAM_TRIGGER_INDEX", "STREAM_CLOCK_SOURCE"],
+                            [0, 0])
+
+        # Configure and start stream, then set the callback.
+        scanRate = ljm.eStreamStart(handle, scansPerRead, numAddresses,
+                                    aScanList, scanRate)
+        print("\nStream started with a scan rate of %0.0f Hz." % scanRate)
+        ljm.setStreamDataCallback(handle, myStreamDataCallback)
+
+        while numReads < numberOfReadsToPerform:
+            time.sleep(0.1)
+    except ljm.LJMError:
+        ljme = sys.exc_info()[1]
+        print(ljme)
+    except Exception:
+        e = sys.exc_info()[1]
+        print(e)
+
+    try:
+        print("\nStop Stream")
+        ljm.eStreamStop(handle)
+    except ljm.LJMError:
+        ljme = sys.exc_info()[1]
+        print(ljme)
+
+    # Close handle
+    ljm.close(handle)
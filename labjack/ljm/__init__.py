@@ -4,6 +4,7 @@ Package for cross-platform wrapper for the LJM library.
 """
 
 from labjack.ljm.ljm import *
+from labjack.ljm.device import Device, forEachHandle
 
 
 __version__ = "1.23.0"
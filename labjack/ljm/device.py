@@ -0,0 +1,477 @@
+"""
+Device objects that cache a handle's information and per-device state.
+
+Example:
+
+    with Device("ANY", "ANY", "ANY") as device:
+        print(device.deviceName, device.serialNumber, device.ipString)
+        ain0, ain1 = device.readNames(["AIN0", "AIN1"])
+
+"""
+import array
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Python 2
+
+from labjack.ljm import constants
+from labjack.ljm import ljm
+from labjack.ljm import packing
+
+
+_DEVICE_NAMES = {
+    constants.dtT4: "T4",
+    constants.dtT7: "T7",
+    constants.dtT8: "T8",
+    constants.dtDIGIT: "DIGIT"
+    }
+
+_TCP_CONNECTION_TYPES = (constants.ctTCP, constants.ctETHERNET,
+                         constants.ctWIFI, constants.ctNETWORK_UDP,
+                         constants.ctETHERNET_UDP, constants.ctWIFI_UDP)
+
+
+class Device(object):
+    """A device connection with cached handle information and
+    per-device caches.
+
+    getHandleInfo is called the first time the information is needed and
+    again after LJM reports that the device reconnected, so attributes
+    such as maxBytesPerMB cost no LJM call. Register names are resolved
+    once, and name operations are planned into packets once (see
+    labjack.ljm.packing) and reused.
+
+    A Device either wraps the handle of an already open device, which it
+    does not close, or opens the device itself in open or __enter__ and
+    closes it in close or __exit__.
+
+    Args:
+        handle: A valid handle to an open device, or None to open the
+            device described by deviceType, connectionType and
+            identifier (see labjack.ljm.openS and labjack.ljm.open).
+        deviceType, connectionType, identifier: The device to open.
+            Strings are passed to openS and integers to open.
+        watchReconnect: If True, the Device listens for device
+            reconnects to refresh the information from open or __enter__
+            until close. The listener runs alongside the callback of
+            registerDeviceReconnectCallback.
+
+    Attributes:
+        handle: The device handle, or None when not open.
+        numReconnects: The number of reconnects reported by LJM.
+        numCalls: The number of LJM read/write calls made by the
+            Device's operations.
+        numPackets: The number of packets sent by the Device's
+            operations.
+        numScans: The number of stream scans read by streamRead.
+
+    """
+    __slots__ = ("handle", "numReconnects", "numCalls", "numPackets",
+                 "numScans", "_info", "_ipString", "_reconnectCallback",
+                 "_watchReconnect", "_watching", "_openArgs", "_owned",
+                 "_names", "_operations", "_streamNumAddresses",
+                 "_streamScanRate", "_streamBuffer")
+
+    def __init__(self, handle=None, deviceType="ANY", connectionType="ANY",
+                 identifier="ANY", watchReconnect=True):
+        self.handle = handle
+        self.numReconnects = 0
+        self.numCalls = 0
+        self.numPackets = 0
+        self.numScans = 0
+        self._info = None
+        self._ipString = None
+        self._reconnectCallback = None
+        self._watchReconnect = watchReconnect
+        self._watching = False
+        self._openArgs = (deviceType, connectionType, identifier)
+        self._owned = False
+        self._names = {}
+        self._operations = {}
+        self._streamNumAddresses = None
+        self._streamScanRate = None
+        self._streamBuffer = None
+
+    def open(self):
+        """Opens the device if it is not open. A Device that wraps a
+        handle only starts listening for reconnects.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        if self.handle is None:
+            deviceType, connectionType, identifier = self._openArgs
+            if (isinstance(deviceType, str) and
+                    isinstance(connectionType, str)):
+                handle = ljm.openS(deviceType, connectionType, identifier)
+            else:
+                handle = ljm.open(deviceType, connectionType, identifier)
+            self.handle = handle
+            self._owned = True
+            _g_devices[handle] = self
+        if self._watchReconnect and not self._watching:
+            ljm._addReconnectListener(self.handle, self._onReconnect)
+            self._watching = True
+
+    def close(self):
+        """Clears the per-device state and, if the Device opened the
+        device, closes it. A stream started with streamStart is stopped.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        handle = self.handle
+        if handle is None:
+            return
+        if _g_devices.get(handle) is self:
+            del _g_devices[handle]
+        streaming = self._streamNumAddresses is not None
+        watching = self._watching
+        owned = self._owned
+        self._forget()
+        try:
+            if streaming:
+                ljm.eStreamStop(handle)
+        finally:
+            try:
+                if watching:
+                    ljm._removeReconnectListener(handle, self._onReconnect)
+            finally:
+                if owned:
+                    ljm.close(handle)
+
+    def _forget(self):
+        # Clears the handle and per-device state without any LJM call.
+        self.handle = None
+        self._watching = False
+        self._owned = False
+        self._info = None
+        self._ipString = None
+        self._names = {}
+        self._operations = {}
+        self._streamNumAddresses = None
+        self._streamBuffer = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def _onReconnect(self, handle):
+        # Called from an LJM thread. Only mark the information stale.
+        self._info = None
+        self.numReconnects += 1
+        if self._reconnectCallback is not None:
+            self._reconnectCallback(handle)
+
+    def setReconnectCallback(self, callback):
+        """Sets a callback called with the handle after the device
+        reconnects, after the cached information is marked stale. Pass
+        None to remove it.
+        """
+        self._reconnectCallback = callback
+
+    def refresh(self):
+        """Reloads the handle information with getHandleInfo."""
+        if self.handle is None:
+            raise ljm.LJMError(errorString="The device is not open.")
+        self._info = ljm.getHandleInfo(self.handle)
+        self._ipString = None
+
+    @property
+    def handleInfo(self):
+        """The cached getHandleInfo tuple: (deviceType, connectionType,
+        serialNumber, ipAddress, port, maxBytesPerMB).
+        """
+        info = self._info
+        if info is None:
+            self.refresh()
+            info = self._info
+        return info
+
+    @property
+    def deviceType(self):
+        return self.handleInfo[0]
+
+    @property
+    def connectionType(self):
+        return self.handleInfo[1]
+
+    @property
+    def serialNumber(self):
+        return self.handleInfo[2]
+
+    @property
+    def ipAddress(self):
+        return self.handleInfo[3]
+
+    @property
+    def port(self):
+        return self.handleInfo[4]
+
+    @property
+    def maxBytesPerMB(self):
+        return self.handleInfo[5]
+
+    @property
+    def ipString(self):
+        """The decimal-dot IP address, or None if the connection is not
+        TCP-based.
+        """
+        ipAddress = self.ipAddress
+        if ipAddress == constants.NO_IP_ADDRESS:
+            return None
+        if self._ipString is None:
+            self._ipString = ljm.numberToIP(ipAddress)
+        return self._ipString
+
+    @property
+    def deviceName(self):
+        """The device type name, such as "T7"."""
+        return _DEVICE_NAMES.get(self.deviceType, str(self.deviceType))
+
+    @property
+    def isTCP(self):
+        """True if the connection is TCP/UDP-based."""
+        return self.connectionType in _TCP_CONNECTION_TYPES
+
+    @property
+    def isUSB(self):
+        """True if the connection is USB."""
+        return self.connectionType == constants.ctUSB
+
+    def resolve(self, aNames):
+        """Returns the (aAddresses, aDataTypes) of register names. Names
+        are resolved with namesToAddresses once and cached.
+        """
+        names = self._names
+        missing = [name for name in aNames if name not in names]
+        if missing:
+            aAddresses, aDataTypes = ljm.namesToAddresses(len(missing),
+                                                          missing)
+            for name, address, dataType in zip(missing, aAddresses,
+                                               aDataTypes):
+                names[name] = (address, dataType)
+        return ([names[name][0] for name in aNames],
+                [names[name][1] for name in aNames])
+
+    def prepare(self, aNames, aWrites, aNumValues, condense=False,
+                allowReorder=False):
+        """Returns the cached PackedOperation of name frames (see
+        labjack.ljm.packing.PackedOperation), planned for the device's
+        packet size.
+        """
+        key = (tuple(aNames), tuple(aWrites), tuple(aNumValues), condense,
+               allowReorder)
+        operation = self._operations.get(key)
+        if operation is None or \
+                operation.maxBytesPerMB != self.maxBytesPerMB:
+            aAddresses, aDataTypes = self.resolve(aNames)
+            operation = packing.PackedOperation(self.maxBytesPerMB,
+                                                aAddresses, aDataTypes,
+                                                aWrites, aNumValues, condense,
+                                                allowReorder)
+            self._operations[key] = operation
+        return operation
+
+    def eNames(self, aNames, aWrites, aNumValues, aValues, condense=False,
+               allowReorder=False):
+        """Performs Modbus operations like labjack.ljm.eNames, packed into
+        the fewest packets, and returns the list of values written/read.
+        See labjack.ljm.packing.eAddresses for condense and allowReorder.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        operation = self.prepare(aNames, aWrites, aNumValues, condense,
+                                 allowReorder)
+        self.numCalls += operation.numPackets
+        self.numPackets += operation.numPackets
+        return operation.execute(self.handle, aValues)
+
+    def readNames(self, aNames):
+        """Returns the list of values of register names.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        return self.eNames(aNames, [constants.READ]*len(aNames),
+                           [1]*len(aNames), None)
+
+    def writeNames(self, aNames, aValues):
+        """Writes values to register names, in order.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        self.eNames(aNames, [constants.WRITE]*len(aNames), [1]*len(aNames),
+                    aValues)
+
+    def readName(self, name):
+        """Returns the value of a register name."""
+        return self.readNames([name])[0]
+
+    def writeName(self, name, value):
+        """Writes a value to a register name."""
+        self.writeNames([name], [value])
+
+    def streamStart(self, scansPerRead, aScanList, scanRate):
+        """Starts a stream of aScanList (register names or addresses), as
+        eStreamStart, and returns the actual scan rate. The data buffer
+        used by streamRead is sized here and reused between streams of
+        the same size.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        aScanList = list(aScanList)
+        names = [i for i in range(len(aScanList))
+                 if isinstance(aScanList[i], str)]
+        if names:
+            aAddresses, _ = self.resolve([aScanList[i] for i in names])
+            for i, address in zip(names, aAddresses):
+                aScanList[i] = address
+        self._streamScanRate = ljm.eStreamStart(self.handle, scansPerRead,
+                                                len(aScanList), aScanList,
+                                                scanRate)
+        self._streamNumAddresses = len(aScanList)
+        dataSize = scansPerRead*len(aScanList)
+        if self._streamBuffer is None or len(self._streamBuffer) != dataSize:
+            self._streamBuffer = array.array("d", [0.0])*dataSize
+        return self._streamScanRate
+
+    def streamRead(self):
+        """Reads stream data like eStreamRead, into the Device's data
+        buffer instead of a new list.
+
+        Returns:
+            A tuple containing:
+            (aData, deviceScanBacklog, ljmScanBacklog)
+
+            aData: An array.array("d") of the interleaved data. It is
+                overwritten by the next streamRead, so copy any values
+                that need to be kept.
+            deviceScanBacklog, ljmScanBacklog: See eStreamRead.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call or
+                streamStart was not called first.
+
+        """
+        if self._streamNumAddresses is None:
+            raise ljm.LJMError(errorString="Streaming has not been started. "
+                                           "Please call streamStart first.")
+        aData = self._streamBuffer
+        deviceScanBacklog, ljmScanBacklog = ljm.eStreamReadInto(self.handle,
+                                                                aData)
+        self.numCalls += 1
+        self.numScans += len(aData)//self._streamNumAddresses
+        return aData, deviceScanBacklog, ljmScanBacklog
+
+    def streamStop(self):
+        """Stops the stream started with streamStart.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        self._streamNumAddresses = None
+        ljm.eStreamStop(self.handle)
+
+    @property
+    def streamScanRate(self):
+        """The actual scan rate of the running stream, or None."""
+        if self._streamNumAddresses is None:
+            return None
+        return self._streamScanRate
+
+    def __repr__(self):
+        return "Device(handle=%r)" % (self.handle, )
+
+
+_g_devices = {}
+
+
+def getDevice(handle):
+    """Returns the cached Device of handle, creating it the first time.
+
+    A Device created here listens for device reconnects until its handle
+    is closed. Devices opened with Device.open are also returned.
+    """
+    device = _g_devices.get(handle)
+    if device is None:
+        device = Device(handle)
+        device.open()
+        _g_devices[handle] = device
+    return device
+
+
+def forgetDevice(handle):
+    """Removes the cached Device of handle, or of all handles if handle
+    is None. Called when a handle is closed with labjack.ljm.close or
+    closeAll, since handle numbers can be reused by later opens. The
+    removed Devices are left closed, so their close does not close the
+    handle again.
+    """
+    if handle is None:
+        devices = list(_g_devices.values())
+        _g_devices.clear()
+    else:
+        devices = [_g_devices.pop(handle, None)]
+    for device in devices:
+        if device is not None:
+            if device._watching:
+                ljm._removeReconnectListener(device.handle,
+                                             device._onReconnect)
+            device._forget()
+
+
+ljm._g_handleCleanupFunctions.append(forgetDevice)
+
+
+def forEachHandle(handles, function, maxWorkers=8):
+    """Calls function(handle) for every handle from at most maxWorkers
+    threads, and returns a {handle: result} dictionary.
+
+    Each result is the return value of function, or the exception it
+    raised. LJM calls on different handles may run concurrently, so up
+    to maxWorkers devices are worked on at a time.
+
+    Raises:
+        ValueError: maxWorkers is less than 1.
+
+    """
+    if maxWorkers < 1:
+        raise ValueError("maxWorkers must be at least 1.")
+    pending = queue.Queue()
+    for handle in handles:
+        pending.put(handle)
+    results = {}
+
+    def work():
+        while True:
+            try:
+                handle = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[handle] = function(handle)
+            except Exception as excep:
+                results[handle] = excep
+
+    threads = [threading.Thread(target=work)
+               for _ in range(min(maxWorkers, pending.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
@@ -2,6 +2,7 @@
 Cross-platform wrapper for the LJM library.
 
 """
+import array
 import ctypes
 import sys
 
@@ -9,33 +10,103 @@ from labjack.ljm import constants
 from labjack.ljm import errorcodes
 
 
-class _StreamCallbackData:
+class _StreamCallbackData(object):
     """Class containing the stream callback information."""
+    __slots__ = ("callbackUser", "callbackLjm", "argInner", "argRef")
+
     def __init__(self, handle, callback):
         self.callbackUser = callback
-        self.callbackWrapper = lambda arg: self.callbackUser(arg[0])
         callbackC = ctypes.CFUNCTYPE(None, ctypes.POINTER(ctypes.c_int))
-        self.callbackLjm = callbackC(self.callbackWrapper)
+        self.callbackLjm = callbackC(self._callback)
         self.argInner = ctypes.c_int(handle)
         self.argRef = ctypes.byref(self.argInner)
 
+    def _callback(self, arg):
+        self.callbackUser(arg[0])
 
-class _ReconnectCallbackData:
-    """Class containing the device reconnect callback information."""
-    def __init__(self, handle, callback):
+
+class _StreamDataCallbackData(object):
+    """Class containing the stream data callback information and the
+    pooled buffer that stream data is read into."""
+    __slots__ = ("callbackUser", "callbackLjm", "argInner", "argRef",
+                 "handle", "buffer", "cData", "dataView", "cD_SBL",
+                 "cLJM_SBL")
+
+    def __init__(self, handle, callback, dataSize):
         self.callbackUser = callback
-        self.callbackWrapper = lambda arg: self.callbackUser(arg)
+        callbackC = ctypes.CFUNCTYPE(None, ctypes.POINTER(ctypes.c_int))
+        self.callbackLjm = callbackC(self._callback)
+        self.argInner = ctypes.c_int(handle)
+        self.argRef = ctypes.byref(self.argInner)
+        self.handle = handle
+        self.buffer = array.array("d", [0.0])*dataSize
+        self.cData = (ctypes.c_double*dataSize).from_buffer(self.buffer)
+        try:
+            self.dataView = memoryview(self.buffer)
+        except TypeError:
+            # Python 2 arrays do not support memoryview.
+            self.dataView = self.buffer
+        self.cD_SBL = ctypes.c_int32(0)
+        self.cLJM_SBL = ctypes.c_int32(0)
+
+    def _callback(self, arg):
+        error = _staticLib.LJM_eStreamRead(self.handle, ctypes.byref(self.cData), ctypes.byref(self.cD_SBL), ctypes.byref(self.cLJM_SBL))
+        if error != errorcodes.NOERROR:
+            self.callbackUser(self.handle, None, 0, 0, LJMError(error))
+        else:
+            self.callbackUser(self.handle, self.dataView, self.cD_SBL.value, self.cLJM_SBL.value, None)
+
+
+class _ReconnectCallbackData(object):
+    """Class containing the device reconnect callback information. LJM
+    holds one reconnect callback per handle, so the user's callback and
+    the listeners added by other modules of this package share it.
+    """
+    __slots__ = ("callbackUser", "listeners", "callbackLjm", "argInner")
+
+    def __init__(self, handle):
+        self.callbackUser = None
+        self.listeners = []
         callbackC = ctypes.CFUNCTYPE(None, ctypes.c_int)
-        self.callbackLjm = callbackC(self.callbackWrapper)
+        self.callbackLjm = callbackC(self._callback)
         self.argInner = ctypes.c_int(handle)
 
+    def _callback(self, arg):
+        for listener in list(self.listeners):
+            listener(arg)
+        callbackUser = self.callbackUser
+        if callbackUser is not None:
+            callbackUser(arg)
+
 
 # Dictionaries for maintaining callback data objects. References need to be kept
 # for the callback duration, otherwise the callback data collector will delete
-# them causing a segfault when LJM tries to call the callback.
+# them causing a segfault when LJM tries to call the callback. Entries are
+# removed when the callback is disabled, the stream is stopped or the handle is
+# closed.
 _g_streamCallbackData = {}
 _g_reconnectCallbackData = {}
 
+# Functions called with a handle after it is closed, or with None after all
+# handles are closed, to release per-handle state kept outside this module.
+_g_handleCleanupFunctions = []
+
+
+def _releaseHandle(handle):
+    """Releases the per-handle state of a closed handle, or of all handles
+    if handle is None.
+    """
+    if handle is None:
+        _g_streamCallbackData.clear()
+        _g_reconnectCallbackData.clear()
+        _g_eStreamDataSize.clear()
+    else:
+        _g_streamCallbackData.pop(handle, None)
+        _g_reconnectCallbackData.pop(handle, None)
+        _g_eStreamDataSize.pop(handle, None)
+    for cleanup in _g_handleCleanupFunctions:
+        cleanup(handle)
+
 
 class LJMError(Exception):
     """Custom exception class for LJM specific errors."""
@@ -438,7 +509,8 @@ def getHandleInfo(handle):
 
 
 def close(handle):
-    """Closes the connection to the device.
+    """Closes the connection to the device and releases the wrapper's
+    stream and reconnect callback data of the handle.
 
     Args:
         handle: A valid handle to an open device.
@@ -451,9 +523,12 @@ def close(handle):
     if error != errorcodes.NOERROR:
         raise LJMError(error)
 
+    _releaseHandle(handle)
+
 
 def closeAll():
-    """Closes all connections to all devices.
+    """Closes all connections to all devices and releases the wrapper's
+    stream and reconnect callback data of all handles.
 
     Raises:
         LJMError: An error was returned from the LJM library call.
@@ -463,6 +538,8 @@ def closeAll():
     if error != errorcodes.NOERROR:
         raise LJMError(error)
 
+    _releaseHandle(None)
+
 
 def cleanInfo(infoHandle):
     """Cleans/deallocates an infoHandle.
@@ -1333,6 +1410,46 @@ def eStreamRead(handle):
     return _convertCtypeArrayToList(cData), cD_SBL.value, cLJM_SBL.value
 
 
+def eStreamReadInto(handle, aData):
+    """Reads data from an initialized and running LJM stream buffer into
+    a caller-provided buffer, like eStreamRead but without allocating
+    a list. Waits for data to become available, if necessary.
+
+    Args:
+        handle: A valid handle to an open device.
+        aData: A writable buffer of C doubles, such as an
+            array.array("d"), a ctypes c_double array or a float64 NumPy
+            array, with room for scansPerRead*numAddresses values (see
+            eStreamStart). The data is written to its start with all
+            channels interleaved.
+
+    Returns:
+        A tuple containing:
+        (deviceScanBacklog, ljmScanBacklog)
+
+        See eStreamRead.
+
+    Raises:
+        LJMError: An error was returned from the LJM library call or
+            eStreamStart was not called first on the handle and
+            the aData size cannot be determined.
+        ValueError: aData is too small.
+
+    """
+    if handle not in _g_eStreamDataSize:
+        raise LJMError(errorString="Streaming has not been started for the given handle. Please call eStreamStart first.")
+    dataSize = _g_eStreamDataSize[handle]
+    cData = _doubleArrayFromBuffer(aData, dataSize)
+    cD_SBL = ctypes.c_int32(0)
+    cLJM_SBL = ctypes.c_int32(0)
+
+    error = _staticLib.LJM_eStreamRead(handle, ctypes.byref(cData), ctypes.byref(cD_SBL), ctypes.byref(cLJM_SBL))
+    if error != errorcodes.NOERROR:
+        raise LJMError(error)
+
+    return cD_SBL.value, cLJM_SBL.value
+
+
 def setStreamCallback(handle, callback):
     """Sets a callback that is called by LJM when the stream has
     collected scansPerRead scans (see eStreamStart) or if an error has
@@ -1359,12 +1476,12 @@ def setStreamCallback(handle, callback):
         want to check which handle had stream data ready.
 
     """
+    cbData = None
     if callback is None or callback == 0:
         cbLjm = 0
         cbArg = 0
     else:
         cbData = _StreamCallbackData(handle, callback)
-        _g_streamCallbackData[handle] = cbData
         cbLjm = cbData.callbackLjm
         cbArg = cbData.argRef
 
@@ -1372,6 +1489,57 @@ def setStreamCallback(handle, callback):
     if error != errorcodes.NOERROR:
         raise LJMError(error)
 
+    if cbData is None:
+        _g_streamCallbackData.pop(handle, None)
+    else:
+        _g_streamCallbackData[handle] = cbData
+
+
+def setStreamDataCallback(handle, callback):
+    """Sets a callback that is called by LJM's stream thread with the
+    stream data when the stream has collected scansPerRead scans (see
+    eStreamStart) or if an error has occurred.
+
+    Unlike setStreamCallback, the wrapper reads the data itself into a
+    buffer allocated once, so the callback does not need to call
+    eStreamRead.
+
+    Args:
+        handle: A valid handle to an open device.
+        callback: The callback function, called as
+            callback(handle, aData, deviceScanBacklog, ljmScanBacklog,
+            error). aData is a memoryview of the C doubles read, with
+            all channels interleaved, and error is None. If the read
+            failed, aData is None and error is the LJMError.
+
+    Raises:
+        LJMError: An error was returned from the LJM library call or
+            eStreamStart was not called first on the handle.
+
+    Notes:
+        setStreamDataCallback should be called after eStreamStart.
+        To disable the previous callback, pass 0 or None as the
+        callback.
+        aData is reused for the next read. Copy values that need to
+        outlive the callback, for example with aData.tolist() or
+        numpy.array(aData). numpy.frombuffer(aData) gives a view of the
+        data without copying.
+        setStreamDataCallback may not be called from within a callback.
+
+    """
+    if callback is None or callback == 0:
+        setStreamCallback(handle, None)
+        return
+    if handle not in _g_eStreamDataSize:
+        raise LJMError(errorString="Streaming has not been started for the given handle. Please call eStreamStart first.")
+    cbData = _StreamDataCallbackData(handle, callback, _g_eStreamDataSize[handle])
+
+    error = _staticLib.LJM_SetStreamCallback(handle, cbData.callbackLjm, cbData.argRef)
+    if error != errorcodes.NOERROR:
+        raise LJMError(error)
+
+    _g_streamCallbackData[handle] = cbData
+
 
 def eStreamStop(handle):
     """Stops the LJM library from streaming any more data from the
@@ -1446,6 +1614,89 @@ def streamBurst(handle, numAddresses, aScanList, scanRate, numScans):
     return cScanRate.value, _convertCtypeArrayToList(cData)
 
 
+def streamBurstInto(handle, numAddresses, aScanList, scanRate, numScans,
+                    aData, progressCallback=None, scansPerRead=None):
+    """Collects a stream burst into a caller-provided buffer, like
+    streamBurst but without allocating the data or converting it to a
+    list.
+
+    Args:
+        handle: A valid handle to an open device.
+        numAddresses: The size of aScanList. The number of addresses to
+            scan.
+        aScanList: A list of Modbus addresses to collect samples from,
+            per scan.
+        scanRate: Sets the desired number of scans per second.
+        numScans: The number of scans to collect. This is how many
+            burst scans are collected and may not be zero.
+        aData: A writable buffer of C doubles, such as an
+            array.array("d"), a ctypes c_double array, a float64 NumPy
+            array or a NumPy memmap, with room for numScans*numAddresses
+            values. The data is written to its start with all addresses
+            interleaved.
+        progressCallback: A function called as
+            progressCallback(numScansCollected, numScans) each time more
+            scans are collected, or None.
+        scansPerRead: The number of scans collected between progress
+            calls. Defaults to a tenth of a second of scans.
+
+    Returns:
+        The actual scan rate that the device scanned at.
+
+    Raises:
+        LJMError: An error was returned from the LJM library call.
+        ValueError: aData is too small.
+
+    Notes:
+        Without progressCallback, LJM_StreamBurst collects the burst.
+        With progressCallback, the burst is collected with eStreamStart,
+        eStreamRead calls writing directly into aData, and eStreamStop.
+        Scans read past numScans by the last read are discarded. This
+        function will block for (numScans / scanRate) seconds or longer.
+
+    """
+    numValues = numScans*numAddresses
+    cData = _doubleArrayFromBuffer(aData, numValues)
+    if progressCallback is None:
+        cNumAddresses = ctypes.c_int32(numAddresses)
+        cScanList_p = _convertListToCtypeArray(aScanList, ctypes.c_int32)
+        cScanRate = ctypes.c_double(scanRate)
+        cNumScans = ctypes.c_uint32(numScans)
+
+        error = _staticLib.LJM_StreamBurst(handle, cNumAddresses, ctypes.byref(cScanList_p), ctypes.byref(cScanRate), cNumScans, ctypes.byref(cData))
+        if error != errorcodes.NOERROR:
+            raise LJMError(error)
+
+        return cScanRate.value
+
+    if scansPerRead is None:
+        scansPerRead = max(1, int(scanRate/10))
+    scansPerRead = min(scansPerRead, numScans)
+    readSize = scansPerRead*numAddresses
+    scanRate = eStreamStart(handle, scansPerRead, numAddresses, aScanList, scanRate)
+    try:
+        valueSize = ctypes.sizeof(ctypes.c_double)
+        lastData = None
+        numCollected = 0
+        while numCollected < numScans:
+            offset = numCollected*numAddresses
+            if offset + readSize <= numValues:
+                eStreamReadInto(handle, (ctypes.c_double*readSize).from_buffer(cData, offset*valueSize))
+                numCollected += scansPerRead
+            else:
+                # The last read is larger than the rest of aData.
+                if lastData is None:
+                    lastData = (ctypes.c_double*readSize)()
+                eStreamReadInto(handle, lastData)
+                ctypes.memmove(ctypes.byref(cData, offset*valueSize), lastData, (numValues - offset)*valueSize)
+                numCollected = numScans
+            progressCallback(numCollected, numScans)
+    finally:
+        eStreamStop(handle)
+
+    return scanRate
+
+
 def getStreamTCPReceiveBufferStatus(handle):
     """Gets the backlog status of the TCP receive buffer.
 
@@ -2805,19 +3056,76 @@ def registerDeviceReconnectCallback(handle, callback):
         None as the callback.
         registerDeviceReconnectCallback may not be called from within a
         callback.
+        Replacing or disabling the callback does not affect the reconnect
+        handling of labjack.ljm.device.Device objects.
 
     """
-    if callback is None or callback == 0:
+    if callback == 0:
+        callback = None
+    cbData = _g_reconnectCallbackData.get(handle)
+    if cbData is not None and (callback is not None or cbData.listeners):
+        # LJM already calls the shared callback.
+        cbData.callbackUser = callback
+        return
+
+    if callback is None:
         cbLjm = 0
     else:
-        cbData = _ReconnectCallbackData(handle, callback)
-        _g_reconnectCallbackData[handle] = cbData
+        cbData = _ReconnectCallbackData(handle)
+        cbData.callbackUser = callback
         cbLjm = cbData.callbackLjm
 
     error = _staticLib.LJM_RegisterDeviceReconnectCallback(handle, cbLjm)
     if error != errorcodes.NOERROR:
         raise LJMError(error)
 
+    if callback is None:
+        _g_reconnectCallbackData.pop(handle, None)
+    else:
+        _g_reconnectCallbackData[handle] = cbData
+
+
+def _addReconnectListener(handle, listener):
+    """Adds a function called with the handle after the device
+    reconnects, before the callback set with
+    registerDeviceReconnectCallback, which it does not replace.
+    """
+    cbData = _g_reconnectCallbackData.get(handle)
+    if cbData is None:
+        cbData = _ReconnectCallbackData(handle)
+        error = _staticLib.LJM_RegisterDeviceReconnectCallback(handle, cbData.callbackLjm)
+        if error != errorcodes.NOERROR:
+            raise LJMError(error)
+        _g_reconnectCallbackData[handle] = cbData
+    cbData.listeners.append(listener)
+
+
+def _removeReconnectListener(handle, listener):
+    """Removes a listener added with _addReconnectListener. The LJM
+    callback is disabled when nothing else uses it.
+    """
+    cbData = _g_reconnectCallbackData.get(handle)
+    if cbData is None or listener not in cbData.listeners:
+        return
+    cbData.listeners.remove(listener)
+    if not cbData.listeners and cbData.callbackUser is None:
+        del _g_reconnectCallbackData[handle]
+        error = _staticLib.LJM_RegisterDeviceReconnectCallback(handle, 0)
+        if error != errorcodes.NOERROR:
+            raise LJMError(error)
+
+
+def getNumCallbackRegistrations():
+    """Returns the number of stream and device reconnect callbacks the
+    wrapper keeps alive, for monitoring that callback data is released.
+
+    Returns:
+        A tuple containing:
+        (numStreamCallbacks, numReconnectCallbacks)
+
+    """
+    return len(_g_streamCallbackData), len(_g_reconnectCallbackData)
+
 
 def _coerceToByteArrayIfString(aBytes):
     """If aBytes is a string, change it into a bytearray."""
@@ -2826,6 +3134,26 @@ def _coerceToByteArrayIfString(aBytes):
     return aBytes
 
 
+def _doubleArrayFromBuffer(buf, numValues):
+    """Returns a ctypes c_double array of numValues sharing the memory of
+    the writable buffer buf."""
+    if isinstance(buf, ctypes.Array):
+        if len(buf) < numValues or buf._type_ is not ctypes.c_double:
+            raise ValueError("Expected a c_double array of at least " + str(numValues) + " values.")
+        return (ctypes.c_double*numValues).from_buffer(buf)
+    if isinstance(buf, array.array):
+        # Python 2 arrays do not support memoryview.
+        if buf.typecode != "d" or len(buf) < numValues:
+            raise ValueError("Expected a \"d\" array of at least " + str(numValues) + " values.")
+        return (ctypes.c_double*numValues).from_buffer(buf)
+    view = memoryview(buf)
+    if view.itemsize != ctypes.sizeof(ctypes.c_double) or view.format not in ("d", "<d", "=d"):
+        raise ValueError("Expected a buffer of C doubles.")
+    if view.nbytes < numValues*view.itemsize:
+        raise ValueError("Expected a buffer of at least " + str(numValues) + " values.")
+    return (ctypes.c_double*numValues).from_buffer(buf)
+
+
 def _convertListToCtypeArray(li, cType):
     """Returns a ctypes list converted from a normal list."""
     return (cType*len(li))(*li)
@@ -0,0 +1,501 @@
+"""
+Packs Modbus Feedback frames into the fewest packets.
+
+When the frames of an eAddresses or eNames call do not fit in one packet,
+LJM either splits them into several packets or fails with
+FRAMES_OMITTED_DUE_TO_PACKET_SIZE, depending on the device, and the caller
+cannot tell which happened or how many packets were used. The functions in
+this module plan the packets themselves with the handle's maxBytesPerMB
+(see getHandleInfo) and the data type sizes, so that each eAddresses call
+they make fits in one packet, and report the number of packets used.
+Frames are performed in the order given unless condensing or reordering
+is requested, which is only safe for registers whose reads have no side
+effects.
+
+Scattered reads of non-buffer registers can also be coalesced into
+contiguous multiple value frames (see coalesceReads), which take 4 bytes
+of command per range instead of per register.
+
+Plans are cached per maxBytesPerMB and frame list, so repeating an
+operation only gathers values and makes the calls.
+
+"""
+import struct
+
+from labjack.ljm import constants
+from labjack.ljm import ljm
+
+
+# Modbus Feedback sizes: the MBAP header and function number, and the
+# per-frame type, address and register count.
+MBFB_HEADER_SIZE = 8
+MBFB_FRAME_SIZE = 4
+
+# Number of bytes of a STRING register.
+_STRING_SIZE = constants.STRING_MAX_SIZE + 1
+
+
+def numRegisters(dataType, numValues):
+    """Returns the number of 16-bit Modbus registers of numValues values
+    of dataType.
+    """
+    if dataType == constants.BYTE:
+        return (numValues + 1)//2
+    if dataType == constants.UINT16:
+        return numValues
+    if dataType == constants.STRING:
+        return numValues*_STRING_SIZE//2
+    return 2*numValues
+
+
+def frameSizes(dataType, write, numValues):
+    """Returns the (command, response) number of bytes a frame adds to a
+    Modbus Feedback packet.
+    """
+    numBytes = 2*numRegisters(dataType, numValues)
+    if write == constants.WRITE:
+        return MBFB_FRAME_SIZE + numBytes, 0
+    return MBFB_FRAME_SIZE, numBytes
+
+
+def condenseFrames(aAddresses, aDataTypes, aWrites, aNumValues,
+                   maxBytesPerMB=None):
+    """Merges consecutive read frames of the same data type whose
+    registers are contiguous into one multiple value frame.
+
+    The merged frames read the same values in the same order, so the
+    aValues list of the frames is unchanged. BYTE and STRING frames are
+    not merged. If maxBytesPerMB is not None, frames are only merged
+    while the merged frame's response fits in one packet.
+
+    Returns:
+        A tuple of the condensed (aAddresses, aDataTypes, aWrites,
+        aNumValues) lists.
+
+    Note:
+        Only use with non-buffer registers. Reading N values from a
+        buffer register reads the same address N times, which is not
+        the same as reading N contiguous registers.
+
+    """
+    maxFrameBytes = None
+    if maxBytesPerMB is not None:
+        maxFrameBytes = maxBytesPerMB - MBFB_HEADER_SIZE
+    outAddresses = []
+    outDataTypes = []
+    outWrites = []
+    outNumValues = []
+    for i in range(len(aAddresses)):
+        dataType = aDataTypes[i]
+        if (outAddresses and
+                aWrites[i] == constants.READ and
+                outWrites[-1] == constants.READ and
+                outDataTypes[-1] == dataType and
+                dataType not in (constants.BYTE, constants.STRING) and
+                aAddresses[i] == outAddresses[-1] +
+                numRegisters(dataType, outNumValues[-1]) and
+                (maxFrameBytes is None or
+                 2*numRegisters(dataType, outNumValues[-1] + aNumValues[i])
+                 <= maxFrameBytes)):
+            outNumValues[-1] += aNumValues[i]
+            continue
+        outAddresses.append(aAddresses[i])
+        outDataTypes.append(dataType)
+        outWrites.append(aWrites[i])
+        outNumValues.append(aNumValues[i])
+    return outAddresses, outDataTypes, outWrites, outNumValues
+
+
+def planPackets(maxBytesPerMB, aDataTypes, aWrites, aNumValues,
+                allowReorder=False):
+    """Groups frames into packets whose Modbus Feedback command and
+    response each fit in maxBytesPerMB.
+
+    Frames are kept in order when any frame is a write, since writes
+    often need to happen in sequence. When every frame is a read and
+    allowReorder is True, frames are packed largest first into the first
+    packet with room (first fit decreasing), which can use fewer packets
+    than keeping the order.
+
+    A frame that does not fit in a packet by itself gets its own packet,
+    and LJM handles it as it would in eAddresses.
+
+    Returns:
+        A list with the list of frame indices of each packet.
+
+    """
+    numFrames = len(aDataTypes)
+    sizes = [frameSizes(aDataTypes[i], aWrites[i], aNumValues[i])
+             for i in range(numFrames)]
+    reorder = allowReorder and constants.WRITE not in aWrites
+    order = list(range(numFrames))
+    if reorder:
+        order.sort(key=lambda i: sizes[i][1], reverse=True)
+
+    packets = []
+    packetSizes = []
+    for i in order:
+        command, response = sizes[i]
+        if reorder:
+            candidates = range(len(packets))
+        else:
+            candidates = range(max(len(packets) - 1, 0), len(packets))
+        for p in candidates:
+            if (packetSizes[p][0] + command <= maxBytesPerMB and
+                    packetSizes[p][1] + response <= maxBytesPerMB):
+                packets[p].append(i)
+                packetSizes[p] = (packetSizes[p][0] + command,
+                                  packetSizes[p][1] + response)
+                break
+        else:
+            packets.append([i])
+            packetSizes.append((MBFB_HEADER_SIZE + command,
+                                MBFB_HEADER_SIZE + response))
+    for packet in packets:
+        packet.sort()
+    return packets
+
+
+class PackedOperation(object):
+    """A list of frames condensed and planned into packets once, which
+    can be performed repeatedly.
+
+    Args:
+        maxBytesPerMB: The maximum packet size of the connection, as
+            returned by getHandleInfo.
+        aAddresses, aDataTypes, aWrites, aNumValues: The frames, as
+            passed to eAddresses.
+        condense: If True, contiguous read frames are merged (see
+            condenseFrames). Only use with non-buffer registers.
+        allowReorder: If True, the frames of an operation without
+            writes may be performed in any order (see planPackets). Do
+            not use with registers whose reads have side effects, such
+            as buffer registers.
+
+    Attributes:
+        numFrames: The number of frames after condensing.
+        numPackets: The number of packets, and eAddresses calls, that
+            each execute costs.
+
+    """
+    def __init__(self, maxBytesPerMB, aAddresses, aDataTypes, aWrites,
+                 aNumValues, condense=False, allowReorder=False):
+        self.maxBytesPerMB = maxBytesPerMB
+        self.numValues = sum(aNumValues)
+        if condense:
+            aAddresses, aDataTypes, aWrites, aNumValues = condenseFrames(
+                aAddresses, aDataTypes, aWrites, aNumValues, maxBytesPerMB)
+        self.numFrames = len(aAddresses)
+
+        offsets = []
+        offset = 0
+        for numValues in aNumValues:
+            offsets.append(offset)
+            offset += numValues
+
+        self._packets = []
+        for frames in planPackets(maxBytesPerMB, aDataTypes, aWrites,
+                                  aNumValues, allowReorder):
+            valueIndices = []
+            for i in frames:
+                valueIndices.extend(range(offsets[i],
+                                          offsets[i] + aNumValues[i]))
+            self._packets.append(([aAddresses[i] for i in frames],
+                                  [aDataTypes[i] for i in frames],
+                                  [aWrites[i] for i in frames],
+                                  [aNumValues[i] for i in frames],
+                                  valueIndices))
+        self.numPackets = len(self._packets)
+
+    def execute(self, handle, aValues=None):
+        """Performs the operation with one eAddresses call per packet.
+
+        Args:
+            handle: A valid handle to an open device.
+            aValues: The list of values, as passed to eAddresses. None
+                when the operation only reads.
+
+        Returns:
+            The list of values written/read, as returned by eAddresses.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+                Packets before the failed one were performed.
+
+        """
+        if aValues is None:
+            aValues = [0]*self.numValues
+        results = list(aValues)
+        for addresses, dataTypes, writes, numValues, valueIndices in \
+                self._packets:
+            packetValues = ljm.eAddresses(handle, len(addresses), addresses,
+                                          dataTypes, writes, numValues,
+                                          [aValues[i] for i in valueIndices])
+            for i, value in zip(valueIndices, packetValues):
+                results[i] = value
+        return results
+
+
+def _convertRaw32(value, dataType):
+    """Returns the value of dataType of a 32-bit register read as UINT32."""
+    value = int(value)
+    if dataType == constants.INT32:
+        if value >= 0x80000000:
+            value -= 0x100000000
+        return value
+    if dataType == constants.FLOAT32:
+        return struct.unpack("<f", struct.pack("<I", value))[0]
+    return value
+
+
+def coalesceReads(aAddresses, aDataTypes, maxGap=0, maxBytesPerMB=None):
+    """Plans reading scattered registers as few contiguous multiple value
+    read frames.
+
+    Registers are sorted by address, and a register is added to the
+    current range when it starts at most maxGap registers after the end
+    of the range and its data type is compatible: UINT16 registers only
+    merge with UINT16 registers, and UINT32, INT32 and FLOAT32 registers
+    merge with each other when 32-bit aligned to the range. Ranges that
+    mix 32-bit data types are read as UINT32 and converted. The values of
+    gap registers are read and discarded.
+
+    Args:
+        aAddresses: List of register addresses, in any order. Addresses
+            may repeat.
+        aDataTypes: List of data types corresponding to aAddresses. BYTE
+            and STRING registers are read with their own frame.
+        maxGap: The maximum number of unrequested registers read to join
+            two ranges. Every register in a gap must be readable.
+        maxBytesPerMB: If not None, ranges are limited to what one
+            packet's response can hold.
+
+    Returns:
+        A tuple containing:
+        (aRanges, aValueMap)
+
+        aRanges: A list of (address, dataType, numValues) read frames.
+        aValueMap: A list with, for each register of aAddresses, the
+            (rangeIndex, valueIndex, dataType) of its value.
+
+    Note:
+        Only use with non-buffer registers.
+
+    """
+    maxRangeBytes = None
+    if maxBytesPerMB is not None:
+        maxRangeBytes = maxBytesPerMB - MBFB_HEADER_SIZE
+    order = sorted(range(len(aAddresses)), key=lambda i: aAddresses[i])
+    ranges = []
+    rangeTypes = []
+    valueMap = [None]*len(aAddresses)
+    for i in order:
+        address = aAddresses[i]
+        dataType = aDataTypes[i]
+        wide = dataType in (constants.UINT32, constants.INT32,
+                            constants.FLOAT32)
+        if ranges:
+            start, rangeType, numValues = ranges[-1]
+            end = start + numRegisters(rangeType, numValues)
+            offset = address - start
+            newEnd = max(end, address + numRegisters(dataType, 1))
+            compatible = (
+                (dataType == constants.UINT16 and
+                 rangeType == constants.UINT16) or
+                (wide and rangeTypes[-1] and offset % 2 == 0))
+            fits = (maxRangeBytes is None or
+                    2*(newEnd - start) <= maxRangeBytes)
+            if compatible and fits and address - end <= maxGap:
+                valueIndex = offset//(numRegisters(rangeType, 1))
+                if rangeType != dataType:
+                    rangeType = constants.UINT32
+                ranges[-1] = (start, rangeType,
+                              (newEnd - start)//numRegisters(rangeType, 1))
+                valueMap[i] = (len(ranges) - 1, valueIndex, dataType)
+                continue
+        ranges.append((address, dataType, 1))
+        rangeTypes.append(wide)
+        valueMap[i] = (len(ranges) - 1, 0, dataType)
+    return ranges, valueMap
+
+
+class CoalescedRead(object):
+    """A read of scattered registers planned once as contiguous ranges
+    (see coalesceReads) packed into the fewest packets (see
+    PackedOperation), which can be performed repeatedly.
+
+    Attributes:
+        numFrames: The number of read frames after coalescing.
+        numPackets: The number of packets, and eAddresses calls, that
+            each read costs.
+
+    """
+    def __init__(self, maxBytesPerMB, aAddresses, aDataTypes, maxGap=0):
+        self._ranges, self._valueMap = coalesceReads(aAddresses, aDataTypes,
+                                                     maxGap, maxBytesPerMB)
+        offsets = []
+        offset = 0
+        for _, _, numValues in self._ranges:
+            offsets.append(offset)
+            offset += numValues
+        self._indices = []
+        for rangeIndex, valueIndex, dataType in self._valueMap:
+            raw = self._ranges[rangeIndex][1] != dataType
+            self._indices.append((offsets[rangeIndex] + valueIndex,
+                                  dataType if raw else None))
+        self._operation = PackedOperation(
+            maxBytesPerMB, [r[0] for r in self._ranges],
+            [r[1] for r in self._ranges],
+            [constants.READ]*len(self._ranges),
+            [r[2] for r in self._ranges], condense=False)
+        self.numFrames = len(self._ranges)
+        self.numPackets = self._operation.numPackets
+
+    def read(self, handle):
+        """Returns the list of register values, in the order of the
+        addresses the read was planned with.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        values = self._operation.execute(handle)
+        results = []
+        for index, rawType in self._indices:
+            if rawType is None:
+                results.append(values[index])
+            else:
+                results.append(_convertRaw32(values[index], rawType))
+        return results
+
+
+def _deviceMaxBytesPerMB(handle):
+    """Returns the maxBytesPerMB of the handle's cached Device."""
+    # Imported here since labjack.ljm.device imports this module.
+    from labjack.ljm import device
+    return device.getDevice(handle).maxBytesPerMB
+
+
+_g_operations = {}
+
+
+def prepare(maxBytesPerMB, aAddresses, aDataTypes, aWrites, aNumValues,
+            condense=False, allowReorder=False):
+    """Returns the cached PackedOperation of the frames, creating it the
+    first time.
+    """
+    key = (maxBytesPerMB, tuple(aAddresses), tuple(aDataTypes),
+           tuple(aWrites), tuple(aNumValues), condense, allowReorder)
+    operation = _g_operations.get(key)
+    if operation is None:
+        operation = PackedOperation(maxBytesPerMB, aAddresses, aDataTypes,
+                                    aWrites, aNumValues, condense,
+                                    allowReorder)
+        _g_operations[key] = operation
+    return operation
+
+
+def clearCache():
+    """Removes all cached operations."""
+    _g_operations.clear()
+
+
+def eAddresses(handle, numFrames, aAddresses, aDataTypes, aWrites,
+               aNumValues, aValues, maxBytesPerMB=None, condense=False,
+               allowReorder=False):
+    """Performs Modbus operations like labjack.ljm.eAddresses, packed
+    into the fewest packets.
+
+    Args:
+        handle: A valid handle to an open device.
+        numFrames, aAddresses, aDataTypes, aWrites, aNumValues, aValues:
+            See labjack.ljm.eAddresses.
+        maxBytesPerMB: The maximum packet size. Default is None, which
+            uses the handle's cached Device (see
+            labjack.ljm.device.getDevice).
+        condense, allowReorder: See PackedOperation. Default is False,
+            which performs the frames as given, in order. Only enable
+            them for registers whose reads have no side effects, not for
+            buffer registers such as STREAM_OUT#(0:3)_BUFFER_*,
+            ASYNCH_DATA_RX or LUA_DEBUG_DATA.
+
+    Returns:
+        A tuple containing:
+        (aValues, numPackets)
+
+        aValues: The list of values written/read.
+        numPackets: The number of packets the operation used.
+
+    Raises:
+        LJMError: An error was returned from the LJM library call.
+
+    """
+    if maxBytesPerMB is None:
+        maxBytesPerMB = _deviceMaxBytesPerMB(handle)
+    operation = prepare(maxBytesPerMB, aAddresses[:numFrames],
+                        aDataTypes[:numFrames], aWrites[:numFrames],
+                        aNumValues[:numFrames], condense, allowReorder)
+    return operation.execute(handle, aValues), operation.numPackets
+
+
+def eReadAddresses(handle, numFrames, aAddresses, aDataTypes,
+                   maxBytesPerMB=None, condense=False, allowReorder=False):
+    """Reads values like labjack.ljm.eReadAddresses, packed into the
+    fewest packets. See eAddresses.
+
+    Returns:
+        A tuple containing:
+        (aValues, numPackets)
+
+    Raises:
+        LJMError: An error was returned from the LJM library call.
+
+    """
+    return eAddresses(handle, numFrames, aAddresses, aDataTypes,
+                      [constants.READ]*numFrames, [1]*numFrames,
+                      [0]*numFrames, maxBytesPerMB, condense, allowReorder)
+
+
+def eNames(handle, numFrames, aNames, aWrites, aNumValues, aValues,
+           maxBytesPerMB=None, condense=False, allowReorder=False):
+    """Performs Modbus operations like labjack.ljm.eNames, packed into
+    the fewest packets. See eAddresses.
+
+    Returns:
+        A tuple containing:
+        (aValues, numPackets)
+
+    Raises:
+        LJMError: An error was returned from the LJM library call.
+
+    """
+    aAddresses, aDataTypes = ljm.namesToAddresses(numFrames, aNames)
+    return eAddresses(handle, numFrames, aAddresses, aDataTypes, aWrites,
+                      aNumValues, aValues, maxBytesPerMB, condense,
+                      allowReorder)
+
+
+def eReadAddressesCoalesced(handle, numFrames, aAddresses, aDataTypes,
+                            maxGap=0, maxBytesPerMB=None):
+    """Reads values like labjack.ljm.eReadAddresses, with the registers
+    coalesced into contiguous ranges (see coalesceReads) and packed into
+    the fewest packets.
+
+    Returns:
+        A tuple containing:
+        (aValues, numPackets)
+
+    Raises:
+        LJMError: An error was returned from the LJM library call.
+
+    """
+    if maxBytesPerMB is None:
+        maxBytesPerMB = _deviceMaxBytesPerMB(handle)
+    key = ("coalesced", maxBytesPerMB, tuple(aAddresses[:numFrames]),
+           tuple(aDataTypes[:numFrames]), maxGap)
+    operation = _g_operations.get(key)
+    if operation is None:
+        operation = CoalescedRead(maxBytesPerMB, aAddresses[:numFrames],
+                                  aDataTypes[:numFrames], maxGap)
+        _g_operations[key] = operation
+    return operation.read(handle), operation.numPackets
@@ -0,0 +1,1885 @@
+"""
+Stream data sinks and processing stages that build on eStreamReadInto and
+setStreamDataCallback.
+
+Processing stages take de-interleaved blocks (see deinterleave) and carry
+their state across blocks, so a stream can be processed block by block at
+full rate without building lists.
+
+This module requires NumPy, and SharedStreamRing requires Python 3.8 or
+later (multiprocessing.shared_memory). It is not imported by labjack.ljm;
+import it with:
+
+    from labjack.ljm import stream
+
+"""
+import collections
+import errno
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing import shared_memory
+except ImportError:
+    resource_tracker = None
+    shared_memory = None
+
+from labjack.ljm import constants
+from labjack.ljm import errorcodes
+from labjack.ljm import ljm
+
+# Held while SharedStreamReader replaces resource_tracker.register, which
+# is process-wide, and while SharedStreamRing creates its shared memory,
+# so the ring's registration is not skipped.
+_g_trackerLock = threading.Lock()
+
+
+def _requireNumpy():
+    if np is None:
+        raise ImportError("labjack.ljm.stream requires NumPy.")
+
+
+# SharedStreamRing memory layout, in int64 words: the ring header, one
+# record per lossless consumer, then one header per slot, followed by the
+# slots' float64 data.
+_RING_MAGIC = 0x4C4A4D52494E4732  # "LJMRING2"
+_RING_HEADER_SIZE = 8
+_RING_MAGIC_INDEX = 0
+_RING_NUM_SLOTS_INDEX = 1
+_RING_NUM_ADDRESSES_INDEX = 2
+_RING_SCANS_PER_READ_INDEX = 3
+_RING_MAX_CONSUMERS_INDEX = 4
+_RING_WRITE_SEQ_INDEX = 5
+_SLOT_HEADER_SIZE = 4
+_SLOT_SEQ = 0
+_SLOT_DEVICE_BACKLOG = 1
+_SLOT_LJM_BACKLOG = 2
+_SLOT_TICK = 3
+# Consumer position of an unused lossless consumer index.
+# Consumer record: the reader's position (the next block it needs, or
+# _CONSUMER_DETACHED) and the detach count it attached at, which only the
+# reader writes, and the number of times the writer detached the consumer,
+# which only the writer writes. A consumer holds slots while its attach
+# count equals the detach count.
+_CONSUMER_SIZE = 3
+_CONSUMER_POSITION = 0
+_CONSUMER_ATTACH = 1
+_CONSUMER_DETACH = 2
+_CONSUMER_DETACHED = -1
+
+
+class _RingLayout(object):
+    """NumPy views of a SharedStreamRing's shared memory."""
+    def __init__(self, buf, numSlots, numAddresses, scansPerRead,
+                 maxConsumers):
+        self.numSlots = numSlots
+        self.numAddresses = numAddresses
+        self.scansPerRead = scansPerRead
+        self.blockSize = numAddresses*scansPerRead
+        consumersEnd = _RING_HEADER_SIZE + maxConsumers*_CONSUMER_SIZE
+        numWords = consumersEnd + numSlots*_SLOT_HEADER_SIZE
+        words = np.ndarray((numWords, ), dtype=np.int64, buffer=buf)
+        self.header = words[:_RING_HEADER_SIZE]
+        self.consumers = words[_RING_HEADER_SIZE:consumersEnd].reshape(
+            maxConsumers, _CONSUMER_SIZE)
+        self.slotHeaders = words[consumersEnd:].reshape(numSlots,
+                                                        _SLOT_HEADER_SIZE)
+        self.data = np.ndarray((numSlots, self.blockSize), dtype=np.float64,
+                               buffer=buf, offset=8*numWords)
+
+    @staticmethod
+    def size(numSlots, numAddresses, scansPerRead, maxConsumers):
+        numWords = _RING_HEADER_SIZE + maxConsumers*_CONSUMER_SIZE + \
+            numSlots*_SLOT_HEADER_SIZE
+        return 8*(numWords + numSlots*numAddresses*scansPerRead)
+
+
+class SharedStreamRing(object):
+    """Shared memory ring buffer of stream blocks that any number of
+    processes can read with SharedStreamReader, without pickling.
+
+    Each slot holds one eStreamRead block (scansPerRead scans of
+    numAddresses interleaved values) with a header of the block's
+    sequence number, device and LJM scan backlogs and host tick
+    (getHostTick microseconds).
+
+    Readers are either drop-oldest, which skip blocks that were
+    overwritten before they read them, or lossless, which use one of the
+    numLosslessConsumers consumer indices. The writer waits for lossless
+    readers to free a slot, so the LJM stream buffer absorbs their delay.
+    A lossless reader that does not free a slot within losslessTimeout
+    seconds is detached and counted in numDetached.
+
+    Args:
+        numAddresses: The number of addresses in the scan list.
+        scansPerRead: The number of scans per block (see eStreamStart).
+        numSlots: The number of blocks the ring holds.
+        name: The shared memory name, or None for a generated name.
+            Readers attach with the name attribute.
+        numLosslessConsumers: The number of lossless consumer indices.
+        losslessTimeout: Seconds to wait for a lossless reader.
+
+    Example:
+
+        ring = SharedStreamRing(numAddresses, scansPerRead)
+        # Start consumer processes with ring.name, then:
+        ljm.eStreamStart(handle, scansPerRead, numAddresses, aScanList,
+                         scanRate)
+        while running:
+            ring.readFromStream(handle)
+
+    """
+    def __init__(self, numAddresses, scansPerRead, numSlots=64, name=None,
+                 numLosslessConsumers=0, losslessTimeout=1.0):
+        _requireNumpy()
+        if shared_memory is None:
+            raise ImportError("SharedStreamRing requires Python 3.8 or "
+                              "later.")
+        self.losslessTimeout = losslessTimeout
+        self.numDetached = 0
+        self.error = None
+        size = _RingLayout.size(numSlots, numAddresses, scansPerRead,
+                                numLosslessConsumers)
+        with _g_trackerLock:
+            self._shm = shared_memory.SharedMemory(name=name, create=True,
+                                                   size=size)
+        self.name = self._shm.name
+        self._layout = _RingLayout(self._shm.buf, numSlots, numAddresses,
+                                   scansPerRead, numLosslessConsumers)
+        header = self._layout.header
+        header[:] = 0
+        header[_RING_NUM_SLOTS_INDEX] = numSlots
+        header[_RING_NUM_ADDRESSES_INDEX] = numAddresses
+        header[_RING_SCANS_PER_READ_INDEX] = scansPerRead
+        header[_RING_MAX_CONSUMERS_INDEX] = numLosslessConsumers
+        self._layout.consumers[:] = 0
+        self._layout.consumers[:, _CONSUMER_POSITION] = _CONSUMER_DETACHED
+        self._layout.slotHeaders[:, _SLOT_SEQ] = -1
+        header[_RING_MAGIC_INDEX] = _RING_MAGIC
+        self._seq = 0
+
+    @property
+    def numBlocksWritten(self):
+        return self._seq
+
+    def _acquireSlot(self):
+        """Waits until the next slot is free of lossless readers, marks
+        it as being written and returns its index.
+        """
+        layout = self._layout
+        seq = self._seq
+        if len(layout.consumers):
+            consumers = layout.consumers
+            deadline = None
+            while True:
+                allPositions = consumers[:, _CONSUMER_POSITION]
+                attached = (allPositions >= 0) & \
+                    (consumers[:, _CONSUMER_ATTACH] ==
+                     consumers[:, _CONSUMER_DETACH])
+                positions = allPositions[attached]
+                if not len(positions) or \
+                        seq - int(positions.min()) < layout.numSlots:
+                    break
+                if deadline is None:
+                    deadline = time.time() + self.losslessTimeout
+                elif time.time() > deadline:
+                    stale = attached & (allPositions == positions.min())
+                    self.numDetached += int(np.count_nonzero(stale))
+                    consumers[stale, _CONSUMER_DETACH] += 1
+                    continue
+                time.sleep(0.0005)
+        slot = seq % layout.numSlots
+        layout.slotHeaders[slot, _SLOT_SEQ] = -1
+        return slot
+
+    def _publishSlot(self, slot, deviceScanBacklog, ljmScanBacklog, tick):
+        layout = self._layout
+        if tick is None:
+            tick = ljm.getHostTick()
+        slotHeader = layout.slotHeaders[slot]
+        slotHeader[_SLOT_DEVICE_BACKLOG] = deviceScanBacklog
+        slotHeader[_SLOT_LJM_BACKLOG] = ljmScanBacklog
+        slotHeader[_SLOT_TICK] = tick
+        slotHeader[_SLOT_SEQ] = self._seq
+        self._seq += 1
+        layout.header[_RING_WRITE_SEQ_INDEX] = self._seq
+
+    def readFromStream(self, handle):
+        """Reads the next stream block with eStreamReadInto directly into
+        the next slot, and returns the (deviceScanBacklog,
+        ljmScanBacklog) tuple.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+                The block is not published.
+
+        """
+        slot = self._acquireSlot()
+        backlogs = ljm.eStreamReadInto(handle, self._layout.data[slot])
+        self._publishSlot(slot, backlogs[0], backlogs[1], None)
+        return backlogs
+
+    def write(self, aData, deviceScanBacklog=0, ljmScanBacklog=0,
+              tick=None):
+        """Copies one block of interleaved stream data into the next slot.
+        tick defaults to the current getHostTick.
+        """
+        slot = self._acquireSlot()
+        self._layout.data[slot] = np.asarray(aData, dtype=np.float64).ravel()
+        self._publishSlot(slot, deviceScanBacklog, ljmScanBacklog, tick)
+
+    def dataCallback(self, handle, aData, deviceScanBacklog, ljmScanBacklog,
+                     error):
+        """A callback for setStreamDataCallback that writes each block.
+        Read errors are stored in the error attribute.
+        """
+        if error is not None:
+            self.error = error
+            return
+        self.write(aData, deviceScanBacklog, ljmScanBacklog)
+
+    def close(self):
+        """Closes and removes the shared memory. Readers that are still
+        attached keep their mapping until they close.
+        """
+        if self._shm is None:
+            return
+        self._layout = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except OSError as excep:
+            # Already removed, for example by a reader's resource tracker
+            # on Python versions without track=False.
+            if excep.errno != errno.ENOENT:
+                raise
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+class SharedStreamReader(object):
+    """Reads stream blocks from a SharedStreamRing, possibly in another
+    process.
+
+    Args:
+        name: The SharedStreamRing's name.
+        consumerIndex: None for a drop-oldest reader, or a lossless
+            consumer index below the ring's numLosslessConsumers that no
+            other reader uses.
+        startAtOldest: If True, the first read returns the oldest block
+            still in the ring instead of the next block written.
+
+    Attributes:
+        numDropped: The number of blocks a drop-oldest reader skipped
+            because they were overwritten before being read.
+        numAddresses, scansPerRead: The ring's block shape.
+
+    """
+    def __init__(self, name, consumerIndex=None, startAtOldest=False,
+                 pollInterval=0.0005):
+        _requireNumpy()
+        if shared_memory is None:
+            raise ImportError("SharedStreamReader requires Python 3.8 or "
+                              "later.")
+        self.pollInterval = pollInterval
+        self.numDropped = 0
+        # Do not let this process's resource tracker remove the writer's
+        # shared memory when this process exits.
+        try:
+            # Python 3.13+
+            self._shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Skip the registration instead of unregistering afterwards: a
+            # forked reader shares the writer's tracker, and unregistering
+            # there would drop the writer's own registration.
+            with _g_trackerLock:
+                register = resource_tracker.register
+                resource_tracker.register = lambda name, rtype: None
+                try:
+                    self._shm = shared_memory.SharedMemory(name=name)
+                finally:
+                    resource_tracker.register = register
+        header = np.ndarray((_RING_HEADER_SIZE, ), dtype=np.int64,
+                            buffer=self._shm.buf)
+        if header[_RING_MAGIC_INDEX] != _RING_MAGIC:
+            self._shm.close()
+            raise ValueError("%s is not a SharedStreamRing." % name)
+        self.numAddresses = int(header[_RING_NUM_ADDRESSES_INDEX])
+        self.scansPerRead = int(header[_RING_SCANS_PER_READ_INDEX])
+        maxConsumers = int(header[_RING_MAX_CONSUMERS_INDEX])
+        self._layout = _RingLayout(self._shm.buf,
+                                   int(header[_RING_NUM_SLOTS_INDEX]),
+                                   self.numAddresses, self.scansPerRead,
+                                   maxConsumers)
+        writeSeq = int(self._layout.header[_RING_WRITE_SEQ_INDEX])
+        self._next = writeSeq
+        if startAtOldest:
+            self._next = max(writeSeq - self._layout.numSlots, 0)
+        self._consumerIndex = consumerIndex
+        self._attachCount = None
+        if consumerIndex is not None:
+            if not 0 <= consumerIndex < maxConsumers:
+                self._shm.close()
+                raise ValueError("consumerIndex must be below %d."
+                                 % maxConsumers)
+            consumer = self._layout.consumers[consumerIndex]
+            self._attachCount = int(consumer[_CONSUMER_DETACH])
+            consumer[_CONSUMER_ATTACH] = self._attachCount
+            consumer[_CONSUMER_POSITION] = self._next
+
+    @property
+    def detached(self):
+        """True if the writer detached this lossless reader for not
+        keeping up. It then continues as a drop-oldest reader.
+        """
+        return self._consumerIndex is not None and \
+            int(self._layout.consumers[self._consumerIndex,
+                                       _CONSUMER_DETACH]) != \
+            self._attachCount
+
+    def read(self, timeout=None):
+        """Returns the next block, or None if no block arrived within
+        timeout seconds (forever if None).
+
+        Returns:
+            A tuple containing:
+            (seq, deviceScanBacklog, ljmScanBacklog, tick, aData)
+
+            aData is a read-only (scansPerRead, numAddresses) view into
+            the shared memory. For lossless readers it stays valid until
+            the next read. Drop-oldest readers should copy it, or check
+            isValid(seq) after using it.
+
+        """
+        layout = self._layout
+        if self._consumerIndex is not None and not self.detached:
+            # Release the previously returned block. The writer detaches
+            # by counting in its own word, not by writing the position,
+            # so a detach between the check and this write still holds.
+            layout.consumers[self._consumerIndex, _CONSUMER_POSITION] = \
+                self._next
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        while True:
+            writeSeq = int(layout.header[_RING_WRITE_SEQ_INDEX])
+            if writeSeq - self._next > layout.numSlots:
+                self.numDropped += writeSeq - layout.numSlots - self._next
+                self._next = writeSeq - layout.numSlots
+            if writeSeq > self._next:
+                seq = self._next
+                slot = seq % layout.numSlots
+                slotHeader = layout.slotHeaders[slot]
+                if int(slotHeader[_SLOT_SEQ]) == seq:
+                    result = (seq, int(slotHeader[_SLOT_DEVICE_BACKLOG]),
+                              int(slotHeader[_SLOT_LJM_BACKLOG]),
+                              int(slotHeader[_SLOT_TICK]))
+                    data = layout.data[slot].reshape(self.scansPerRead,
+                                                     self.numAddresses)
+                    data = data.view()
+                    data.flags.writeable = False
+                    self._next = seq + 1
+                    if int(slotHeader[_SLOT_SEQ]) == seq:
+                        return result + (data, )
+                # Overwritten while reading; skip to the oldest block.
+                self.numDropped += 1
+                self._next = seq + 1
+                continue
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(self.pollInterval)
+
+    def isValid(self, seq):
+        """Returns True if block seq has not been overwritten."""
+        slot = seq % self._layout.numSlots
+        return int(self._layout.slotHeaders[slot, _SLOT_SEQ]) == seq
+
+    def close(self):
+        """Detaches from the ring."""
+        if self._shm is None:
+            return
+        if self._consumerIndex is not None:
+            self._layout.consumers[self._consumerIndex,
+                                   _CONSUMER_POSITION] = _CONSUMER_DETACHED
+        self._layout = None
+        self._shm.close()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def deinterleave(aData, numAddresses):
+    """Returns stream data with all channels interleaved (as returned by
+    eStreamRead) as a (numAddresses, numScans) array, one row per
+    channel. For buffers such as the memoryview passed by
+    setStreamDataCallback, the result is a view without copying.
+    """
+    _requireNumpy()
+    return np.asarray(aData, dtype=np.float64).reshape(-1, numAddresses).T
+
+
+class _GroupReducer(object):
+    """Base class of reducers that reduce each group of factor
+    consecutive samples of every channel to one output, carrying the
+    samples of an incomplete group to the next block.
+    """
+    def __init__(self, factor, numChannels):
+        _requireNumpy()
+        self.factor = factor
+        self.numChannels = numChannels
+        self._tail = np.empty((numChannels, 0))
+
+    def reset(self):
+        """Discards the samples of the incomplete group."""
+        self._tail = np.empty((self.numChannels, 0))
+
+    def process(self, block):
+        """Reduces a (numChannels, numScans) block, as returned by
+        deinterleave, and returns the reduced output of the groups it
+        completes.
+        """
+        if self._tail.shape[1]:
+            block = np.concatenate((self._tail, block), axis=1)
+        numGroups = block.shape[1]//self.factor
+        end = numGroups*self.factor
+        self._tail = block[:, end:].copy()
+        groups = block[:, :end].reshape(self.numChannels, numGroups,
+                                        self.factor)
+        return self._reduce(groups)
+
+    def processInterleaved(self, aData):
+        """Reduces a block of interleaved stream data."""
+        return self.process(deinterleave(aData, self.numChannels))
+
+
+class BlockAverage(_GroupReducer):
+    """Decimates by averaging each group of factor samples of every
+    channel. process returns a (numChannels, numOutputs) array.
+    """
+    def _reduce(self, groups):
+        return groups.mean(axis=2)
+
+
+class MinMaxEnvelope(_GroupReducer):
+    """Reduces each group of factor samples of every channel to its
+    minimum and maximum, for plotting envelopes. process returns a
+    (mins, maxs) tuple of (numChannels, numOutputs) arrays.
+    """
+    def _reduce(self, groups):
+        return groups.min(axis=2), groups.max(axis=2)
+
+
+def firLowpass(factor, numTaps=None):
+    """Returns the taps of a Hamming windowed-sinc low-pass filter with a
+    cutoff at the Nyquist frequency after decimating by factor, with unity
+    DC gain. numTaps defaults to 8*factor + 1.
+    """
+    _requireNumpy()
+    if numTaps is None:
+        numTaps = 8*factor + 1
+    n = np.arange(numTaps) - (numTaps - 1)/2.0
+    taps = np.sinc(n/factor)*np.hamming(numTaps)
+    return taps/taps.sum()
+
+
+def cicTaps(factor, order=3):
+    """Returns the FIR taps of a CIC filter with differential delay 1,
+    normalized to unity DC gain: order boxcars of length factor
+    convolved together.
+    """
+    _requireNumpy()
+    taps = np.ones(1)
+    for _ in range(order):
+        taps = np.convolve(taps, np.ones(factor))
+    return taps/taps.sum()
+
+
+class FIRDecimator(object):
+    """Filters every channel with FIR taps and keeps every factor-th
+    output, carrying filter history across blocks. Only the kept
+    outputs are computed.
+
+    The output for input sample i, counted from the first sample
+    processed, is produced when i % factor == factor - 1. The filter
+    history starts at zero.
+
+    process returns a (numChannels, numOutputs) array.
+    """
+    def __init__(self, taps, factor, numChannels):
+        _requireNumpy()
+        self.taps = np.asarray(taps, dtype=np.float64)
+        self.factor = factor
+        self.numChannels = numChannels
+        self.reset()
+
+    def reset(self):
+        """Clears the filter history."""
+        self._history = np.zeros((self.numChannels, len(self.taps) - 1))
+        self._count = 0
+
+    def process(self, block):
+        """Filters and decimates a (numChannels, numScans) block, as
+        returned by deinterleave.
+        """
+        numTaps = len(self.taps)
+        numScans = block.shape[1]
+        ext = np.concatenate((self._history, block), axis=1)
+        first = (self.factor - 1 - self._count) % self.factor
+        numOutputs = 0
+        if first < numScans:
+            numOutputs = (numScans - 1 - first)//self.factor + 1
+        rowStride, colStride = ext.strides
+        windows = np.lib.stride_tricks.as_strided(
+            ext[:, first:], shape=(self.numChannels, numOutputs, numTaps),
+            strides=(rowStride, colStride*self.factor, colStride),
+            writeable=False)
+        output = windows.dot(self.taps[::-1])
+        if numTaps > 1:
+            self._history = ext[:, ext.shape[1] - (numTaps - 1):].copy()
+        self._count += numScans
+        return output
+
+    def processInterleaved(self, aData):
+        """Filters and decimates a block of interleaved stream data."""
+        return self.process(deinterleave(aData, self.numChannels))
+
+
+class CICDecimator(FIRDecimator):
+    """Decimates by factor with a CIC (cascaded integrator-comb) response
+    of the given order, with unity DC gain. The filter is applied in its
+    equivalent FIR form, which does not accumulate rounding error in
+    integrators over long streams.
+    """
+    def __init__(self, factor, numChannels, order=3):
+        FIRDecimator.__init__(self, cicTaps(factor, order), factor,
+                              numChannels)
+        self.order = order
+
+
+# Trigger edges.
+RISING = 1
+FALLING = 2
+EITHER = RISING | FALLING
+
+
+class TriggerCapture(collections.namedtuple("TriggerCapture",
+                                            "scanIndex data")):
+    """A window of stream data around a trigger.
+
+    scanIndex: The index of the trigger scan, counted from the first scan
+        processed.
+    data: A (numChannels, preTriggerScans + postTriggerScans) array. The
+        trigger scan is column preTriggerScans. Scans before the first scan
+        processed are NaN.
+    """
+    __slots__ = ()
+
+
+class TriggeredCapture(object):
+    """Captures fixed-length windows of de-interleaved stream data around
+    software trigger events, keeping only a fixed-size pre-trigger ring
+    buffer, so memory stays bounded over any stream length.
+
+    A trigger occurs when channel crosses level on the selected edge
+    between consecutive scans, including across blocks. Triggers within
+    holdoffScans of the previous trigger are ignored.
+
+    Args:
+        numChannels: The number of addresses in the scan list.
+        channel: The scan list index of the trigger channel.
+        level: The trigger level.
+        edge: RISING, FALLING or EITHER.
+        preTriggerScans: The number of scans kept before the trigger
+            scan.
+        postTriggerScans: The number of scans kept from the trigger scan
+            on.
+        holdoffScans: The minimum number of scans between triggers.
+            Defaults to the window length, so windows do not overlap.
+        callback: If not None, called with each TriggerCapture as it
+            completes.
+
+    """
+    def __init__(self, numChannels, channel, level, edge=RISING,
+                 preTriggerScans=0, postTriggerScans=1000,
+                 holdoffScans=None, callback=None):
+        _requireNumpy()
+        self.numChannels = numChannels
+        self.channel = channel
+        self.level = level
+        self.edge = edge
+        self.preTriggerScans = preTriggerScans
+        self.postTriggerScans = postTriggerScans
+        if holdoffScans is None:
+            holdoffScans = preTriggerScans + postTriggerScans
+        self.holdoffScans = max(holdoffScans, 1)
+        self.callback = callback
+        self.numTriggers = 0
+        self._ring = np.empty((numChannels, preTriggerScans))
+        self._readBuffer = None
+        self.reset()
+
+    def reset(self):
+        """Clears the pre-trigger buffer and pending captures."""
+        self._ringPos = 0
+        self._ringCount = 0
+        self._count = 0
+        self._last = None
+        self._nextAllowed = 0
+        # [triggerScanIndex, data, filledUpToScanIndex] of incomplete
+        # captures.
+        self._pending = []
+
+    def _findTriggers(self, x, start):
+        """Returns the scan indices of the accepted triggers in x, the
+        trigger channel's samples from scan index start.
+        """
+        if self._last is None:
+            prev = x[:-1]
+            offset = 1
+            x = x[1:]
+        else:
+            prev = np.concatenate(((self._last, ), x[:-1]))
+            offset = 0
+        mask = np.zeros(len(x), dtype=bool)
+        if self.edge & RISING:
+            mask |= (prev < self.level) & (x >= self.level)
+        if self.edge & FALLING:
+            mask |= (prev > self.level) & (x <= self.level)
+        candidates = np.flatnonzero(mask) + (start + offset)
+        triggers = []
+        i = np.searchsorted(candidates, self._nextAllowed)
+        while i < len(candidates):
+            scanIndex = int(candidates[i])
+            triggers.append(scanIndex)
+            self._nextAllowed = scanIndex + self.holdoffScans
+            i = np.searchsorted(candidates, self._nextAllowed)
+        return triggers
+
+    def _fillFromRing(self, pending, start):
+        """Fills a new capture's scans that are in the pre-trigger
+        buffer, which holds the scans just before scan index start.
+        """
+        windowStart = pending[0] - self.preTriggerScans
+        first = max(windowStart, start - self._ringCount)
+        if first >= start:
+            return
+        positions = (self._ringPos - (start - np.arange(first, start))) % \
+            self.preTriggerScans
+        pending[1][:, first - windowStart:start - windowStart] = \
+            self._ring[:, positions]
+
+    def process(self, block):
+        """Processes a (numChannels, numScans) block, as returned by
+        deinterleave, and returns the list of TriggerCaptures completed.
+        """
+        numScans = block.shape[1]
+        if numScans == 0:
+            return []
+        start = self._count
+        windowLength = self.preTriggerScans + self.postTriggerScans
+        for scanIndex in self._findTriggers(block[self.channel], start):
+            pending = [scanIndex, np.full((self.numChannels, windowLength),
+                                          np.nan), start]
+            self._fillFromRing(pending, start)
+            self._pending.append(pending)
+            self.numTriggers += 1
+
+        completed = []
+        end = start + numScans
+        for pending in self._pending:
+            windowStart = pending[0] - self.preTriggerScans
+            lo = max(pending[2], windowStart)
+            hi = min(windowStart + windowLength, end)
+            pending[1][:, lo - windowStart:hi - windowStart] = \
+                block[:, lo - start:hi - start]
+            pending[2] = hi
+            if hi == windowStart + windowLength:
+                completed.append(TriggerCapture(pending[0], pending[1]))
+        if completed:
+            self._pending = [p for p in self._pending
+                             if p[2] < p[0] + self.postTriggerScans]
+
+        if self.preTriggerScans:
+            numKept = min(numScans, self.preTriggerScans)
+            positions = (self._ringPos + np.arange(numKept)) % \
+                self.preTriggerScans
+            self._ring[:, positions] = block[:, numScans - numKept:]
+            self._ringPos = (self._ringPos + numKept) % self.preTriggerScans
+            self._ringCount = min(self._ringCount + numScans,
+                                  self.preTriggerScans)
+        self._last = block[self.channel, -1]
+        self._count = end
+
+        if self.callback is not None:
+            for capture in completed:
+                self.callback(capture)
+        return completed
+
+    def processInterleaved(self, aData):
+        """Processes a block of interleaved stream data."""
+        return self.process(deinterleave(aData, self.numChannels))
+
+    def readFromStream(self, handle, scansPerRead):
+        """Reads one block with eStreamReadInto into a buffer allocated
+        once, processes it and returns the list of TriggerCaptures
+        completed.
+
+        A stream that waits for a hardware trigger (STREAM_TRIGGER_INDEX)
+        with the STREAM_SCANS_RETURN_ALL_OR_NONE library setting raises
+        NO_SCANS_RETURNED until it triggers, which returns an empty list.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        size = self.numChannels*scansPerRead
+        if self._readBuffer is None or len(self._readBuffer) != size:
+            self._readBuffer = np.empty(size)
+        try:
+            ljm.eStreamReadInto(handle, self._readBuffer)
+        except ljm.LJMError as excep:
+            if excep.errorCode == errorcodes.NO_SCANS_RETURNED:
+                return []
+            raise
+        return self.processInterleaved(self._readBuffer)
+
+
+class ScanTimestamper(object):
+    """Reconstructs per-scan timestamps from a timer streamed with the
+    scan list, such as CORE_TIMER or SYSTEM_TIMER_20HZ.
+
+    A 32-bit register in a stream scan list returns its lower 16 bits,
+    and STREAM_DATA_CAPTURE_16 (streamed right after it) returns the
+    upper 16 bits of the same reading. The halves are combined, and timer
+    rollovers are unwrapped across blocks, giving the device time of
+    every scan.
+
+    When process is given the host tick (getHostTick) at which the block
+    was read, the device time of the block's last scan is paired with
+    the host tick minus the scan backlogs' duration, and a linear fit of
+    the last fitLength pairs maps device time to host time. The fit's
+    slope is the timer's frequency relative to the host clock, so clock
+    drift is tracked.
+
+    Args:
+        numChannels: The number of addresses in the scan list.
+        timerChannel: The scan list index of the timer (its lower 16
+            bits).
+        captureChannel: The scan list index of STREAM_DATA_CAPTURE_16
+            holding the timer's upper 16 bits, or None if only 16 bits
+            are streamed. A 16-bit timer must not roll over between two
+            scans.
+        timerFrequency: The timer's nominal frequency in Hz, such as 20
+            for SYSTEM_TIMER_20HZ or the core timer frequency of the
+            device for CORE_TIMER.
+        scanRate: The stream's scan rate, used to convert backlogs to
+            time.
+        fitLength: The number of blocks in the running fit.
+
+    Attributes:
+        drift: The timer frequency error relative to the host clock as a
+            fraction (1e-6 is 1 ppm fast), once two blocks were fitted.
+
+    """
+    def __init__(self, numChannels, timerChannel, captureChannel,
+                 timerFrequency, scanRate, fitLength=64):
+        _requireNumpy()
+        self.numChannels = numChannels
+        self.timerChannel = timerChannel
+        self.captureChannel = captureChannel
+        self.timerFrequency = float(timerFrequency)
+        self.scanRate = float(scanRate)
+        self.fitLength = fitLength
+        if captureChannel is None:
+            self._modulus = 1 << 16
+        else:
+            self._modulus = 1 << 32
+        self.reset()
+
+    def reset(self):
+        """Forgets the unwrapping state and the fit."""
+        self._lastRaw = None
+        self._wrapOffset = 0
+        self._fitDevice = collections.deque(maxlen=self.fitLength)
+        self._fitHost = collections.deque(maxlen=self.fitLength)
+        self._slope = None
+        self._intercept = None
+        self.drift = 0.0
+
+    def deviceTicks(self, block):
+        """Returns the unwrapped timer counts of the scans of a
+        (numChannels, numScans) block, as int64.
+        """
+        raw = block[self.timerChannel].astype(np.int64)
+        if self.captureChannel is not None:
+            raw += block[self.captureChannel].astype(np.int64) << 16
+        if len(raw) == 0:
+            return raw
+        if self._lastRaw is None:
+            previous = raw[:1]
+        else:
+            previous = np.array([self._lastRaw], dtype=np.int64)
+        wraps = np.cumsum(np.diff(np.concatenate((previous, raw))) < 0)
+        ticks = raw + (self._wrapOffset + wraps*self._modulus)
+        self._wrapOffset += int(wraps[-1])*self._modulus
+        self._lastRaw = int(raw[-1])
+        return ticks
+
+    def _fit(self):
+        device = np.array(self._fitDevice)
+        host = np.array(self._fitHost)
+        if len(device) < 2 or device[-1] == device[0]:
+            # Nominal rate until there are two points.
+            self._slope = 1e6
+            self._intercept = host[-1] - 1e6*device[-1]
+            return
+        deviceMean = device.mean()
+        hostMean = host.mean()
+        centered = device - deviceMean
+        self._slope = (centered*(host - hostMean)).sum()/ \
+            (centered*centered).sum()
+        self._intercept = hostMean - self._slope*deviceMean
+        self.drift = 1e6/self._slope - 1
+
+    def process(self, block, hostTick=None, backlogScans=0):
+        """Returns the timestamps of the scans of a (numChannels,
+        numScans) block, as returned by deinterleave.
+
+        Args:
+            block: The block.
+            hostTick: The getHostTick value, in microseconds, right after
+                the block was read, or None.
+            backlogScans: The deviceScanBacklog plus ljmScanBacklog of
+                the read.
+
+        Returns:
+            An array of host times in microseconds (getHostTick clock),
+            or of device times in seconds from timer count 0 if neither
+            this nor a previous call was given a hostTick.
+
+        """
+        seconds = self.deviceTicks(block)/self.timerFrequency
+        if hostTick is not None and len(seconds):
+            self._fitDevice.append(seconds[-1])
+            self._fitHost.append(hostTick - 1e6*backlogScans/self.scanRate)
+            self._fit()
+        if self._slope is None:
+            return seconds
+        return self._intercept + self._slope*seconds
+
+    def processInterleaved(self, aData, hostTick=None, backlogScans=0):
+        """Returns the timestamps of a block of interleaved stream
+        data (see process).
+        """
+        return self.process(deinterleave(aData, self.numChannels), hostTick,
+                            backlogScans)
+
+
+class MultiDeviceBlock(collections.namedtuple("MultiDeviceBlock",
+                                              "scanIndex data backlogs")):
+    """One aligned block of a MultiDeviceStream.
+
+    scanIndex: The index of the block's first scan.
+    data: A (numDevices, numChannels, scansPerRead) array, de-interleaved per
+        device, in the order of the handles.
+    backlogs: A (numDevices, 2) array of each device's (deviceScanBacklog,
+        ljmScanBacklog) for the block.
+    """
+    __slots__ = ()
+
+
+class MultiDeviceStream(object):
+    """Streams the same scan list from several devices and merges their
+    blocks into aligned multi-device blocks by scan index.
+
+    The streams are configured, then started from one thread per device
+    released together, so the starts are as close together as the host
+    allows. With externalClock, each device is set to externally clocked
+    stream (as in stream_external_clock.py) and waits for the shared
+    clock after starting, so scan 0 is the same clock edge on every
+    device. One thread per device reads its stream with eStreamReadInto,
+    and read returns each block once every device has delivered it.
+
+    Each device keeps at most maxQueuedBlocks blocks that read has not
+    returned yet. When a device's queue is full, its oldest block is
+    dropped and counted in numDropped, and read skips the other devices'
+    blocks of the same scans, so the returned blocks stay aligned and
+    their scanIndex shows the gap.
+
+    Args:
+        handles: The device handles.
+        aScanList: The scan list, as register names or addresses.
+        scanRate: The scan rate.
+        scansPerRead: The number of scans per block.
+        externalClock: If True, STREAM_CLOCK_SOURCE is set to the
+            external clock (2) with externalClockDivisor. Otherwise the
+            internal clock (0) is used.
+        externalClockDivisor: STREAM_EXTERNAL_CLOCK_DIVISOR.
+        receiveTimeoutMS: With externalClock, the manual
+            LJM_STREAM_RECEIVE_TIMEOUT_MS.
+        maxQueuedBlocks: The number of blocks queued per device.
+        pollInterval: The seconds a reading thread waits after a read
+            returned no scans.
+
+    Attributes:
+        scanRates: The actual scan rate of each device, once started.
+        backlogs: A (numDevices, 2) array of each device's latest
+            (deviceScanBacklog, ljmScanBacklog).
+        maxBacklogs: The largest backlogs seen for each device.
+        numDropped: The number of blocks of each device dropped since
+            start.
+
+    """
+    def __init__(self, handles, aScanList, scanRate, scansPerRead,
+                 externalClock=False, externalClockDivisor=1,
+                 receiveTimeoutMS=100, maxQueuedBlocks=64,
+                 pollInterval=0.001):
+        _requireNumpy()
+        self.handles = list(handles)
+        aScanList = list(aScanList)
+        if aScanList and isinstance(aScanList[0], str):
+            aScanList = ljm.namesToAddresses(len(aScanList), aScanList)[0]
+        self.aScanList = aScanList
+        self.numChannels = len(aScanList)
+        self.scanRate = scanRate
+        self.scansPerRead = scansPerRead
+        self.externalClock = externalClock
+        self.externalClockDivisor = externalClockDivisor
+        self.receiveTimeoutMS = receiveTimeoutMS
+        self.maxQueuedBlocks = maxQueuedBlocks
+        self.pollInterval = pollInterval
+        numDevices = len(self.handles)
+        self.scanRates = [None]*numDevices
+        self.backlogs = np.zeros((numDevices, 2), dtype=np.int64)
+        self.maxBacklogs = np.zeros((numDevices, 2), dtype=np.int64)
+        self.numDropped = [0]*numDevices
+        self._pending = [collections.deque() for _ in self.handles]
+        self._condition = threading.Condition()
+        self._threads = []
+        self._goEvent = threading.Event()
+        self._stopEvent = threading.Event()
+        self._started = threading.Semaphore(0)
+        self._errors = [None]*numDevices
+        self._savedConfigs = None
+
+    def configure(self):
+        """Writes the stream clock and trigger configuration of every
+        device with one eWriteNames call each. T4s are skipped.
+
+        With externalClock, the LJM library configuration is also set so
+        that reads return NO_SCANS_RETURNED instead of waiting for a full
+        block (STREAM_SCANS_RETURN_ALL_OR_NONE), with a manual receive
+        timeout, so a device waiting for its clock does not time out.
+        This configuration applies to every stream of the process, so
+        the previous values are saved and stop restores them.
+        """
+        aNames = ["STREAM_TRIGGER_INDEX", "STREAM_CLOCK_SOURCE"]
+        aValues = [0, 0]
+        if self.externalClock:
+            aNames.append("STREAM_EXTERNAL_CLOCK_DIVISOR")
+            aValues = [0, 2, self.externalClockDivisor]
+            configs = [(constants.STREAM_SCANS_RETURN,
+                        constants.STREAM_SCANS_RETURN_ALL_OR_NONE),
+                       (constants.STREAM_RECEIVE_TIMEOUT_MODE,
+                        constants.STREAM_RECEIVE_TIMEOUT_MODE_MANUAL),
+                       (constants.STREAM_RECEIVE_TIMEOUT_MS,
+                        self.receiveTimeoutMS)]
+            if self._savedConfigs is None:
+                self._savedConfigs = [(name, ljm.readLibraryConfigS(name))
+                                      for name, _ in configs]
+            for name, value in configs:
+                ljm.writeLibraryConfigS(name, value)
+        for handle in self.handles:
+            # The T4 does not have these registers.
+            if ljm.getHandleInfo(handle)[0] != constants.dtT4:
+                ljm.eWriteNames(handle, len(aNames), aNames, aValues)
+
+    def start(self):
+        """Configures and starts the streams, and starts reading them.
+
+        Raises:
+            LJMError: A device failed to configure or start. Streams that
+                started are stopped.
+
+        """
+        try:
+            self.configure()
+        except ljm.LJMError:
+            self.stop()
+            raise
+        self._goEvent.clear()
+        self._stopEvent.clear()
+        self.numDropped = [0]*len(self.handles)
+        self._errors = [None]*len(self.handles)
+        startErrors = [None]*len(self.handles)
+        self._threads = []
+        for index in range(len(self.handles)):
+            thread = threading.Thread(target=self._run,
+                                      args=(index, startErrors))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        self._goEvent.set()
+        for _ in self._threads:
+            self._started.acquire()
+        for error in startErrors:
+            if error is not None:
+                self.stop()
+                raise error
+
+    def _run(self, index, startErrors):
+        handle = self.handles[index]
+        self._goEvent.wait()
+        try:
+            self.scanRates[index] = ljm.eStreamStart(
+                handle, self.scansPerRead, self.numChannels, self.aScanList,
+                self.scanRate)
+        except ljm.LJMError as excep:
+            startErrors[index] = excep
+            self._started.release()
+            return
+        self._started.release()
+        size = self.numChannels*self.scansPerRead
+        pending = self._pending[index]
+        blockIndex = 0
+        try:
+            while not self._stopEvent.is_set():
+                aData = np.empty(size)
+                try:
+                    backlogs = ljm.eStreamReadInto(handle, aData)
+                except ljm.LJMError as excep:
+                    if excep.errorCode == errorcodes.NO_SCANS_RETURNED:
+                        # Waiting for the external clock or a full block.
+                        self._stopEvent.wait(self.pollInterval)
+                        continue
+                    raise
+                self.backlogs[index] = backlogs
+                np.maximum(self.maxBacklogs[index], backlogs,
+                           out=self.maxBacklogs[index])
+                with self._condition:
+                    if len(pending) >= self.maxQueuedBlocks:
+                        pending.popleft()
+                        self.numDropped[index] += 1
+                    pending.append((blockIndex, aData, backlogs))
+                    self._condition.notify_all()
+                blockIndex += 1
+        except ljm.LJMError as excep:
+            if not self._stopEvent.is_set():
+                with self._condition:
+                    self._errors[index] = excep
+                    self._condition.notify_all()
+
+    def _popAligned(self):
+        # Drops the blocks that other devices no longer have, and returns
+        # the next block of every device if they are aligned, else None.
+        pending = self._pending
+        for index in range(len(pending)):
+            if not pending[index] and self._errors[index] is not None:
+                raise self._errors[index]
+        if not all(pending):
+            return None
+        target = max(blocks[0][0] for blocks in pending)
+        for index in range(len(pending)):
+            blocks = pending[index]
+            while blocks and blocks[0][0] < target:
+                blocks.popleft()
+                self.numDropped[index] += 1
+            if not blocks:
+                return None
+        return [blocks.popleft() for blocks in pending]
+
+    def read(self, timeout=None):
+        """Returns the next MultiDeviceBlock, or None if a device did not
+        deliver it within timeout seconds (forever if None).
+
+        Raises:
+            LJMError: A device's stream read failed.
+
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                items = self._popAligned()
+                if items is not None:
+                    break
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                self._condition.wait(remaining)
+        data = np.empty((len(items), self.numChannels, self.scansPerRead))
+        for index in range(len(items)):
+            data[index] = deinterleave(items[index][1], self.numChannels)
+        backlogs = np.array([item[2] for item in items], dtype=np.int64)
+        return MultiDeviceBlock(items[0][0]*self.scansPerRead, data,
+                                backlogs)
+
+    def stop(self):
+        """Stops the streams and the reading threads, and restores the
+        library configuration changed by configure. Blocks that were
+        read but not returned by read are discarded.
+        """
+        self._stopEvent.set()
+        self._goEvent.set()
+        error = None
+        for index in range(len(self.handles)):
+            if self.scanRates[index] is None:
+                continue
+            self.scanRates[index] = None
+            try:
+                ljm.eStreamStop(self.handles[index])
+            except ljm.LJMError as excep:
+                if excep.errorCode != errorcodes.STREAM_NOT_RUNNING:
+                    error = excep
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        for pending in self._pending:
+            pending.clear()
+        self._errors = [None]*len(self.handles)
+        savedConfigs = self._savedConfigs
+        self._savedConfigs = None
+        for name, value in savedConfigs or []:
+            try:
+                ljm.writeLibraryConfigS(name, value)
+            except ljm.LJMError as excep:
+                error = error or excep
+        if error is not None:
+            raise error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+
+class StreamBlock(collections.namedtuple(
+        "StreamBlock", "scanIndex data deviceScanBacklog ljmScanBacklog")):
+    """A block of stream data read by a SupervisedStream.
+
+    scanIndex: The index of the block's first scan, counting the scans of
+        earlier gaps.
+    data: The interleaved list of values, as returned by eStreamRead.
+    deviceScanBacklog, ljmScanBacklog: The backlogs returned by
+        eStreamRead.
+    """
+    __slots__ = ()
+
+
+class StreamGap(collections.namedtuple(
+        "StreamGap", "scanIndex startTime duration numScans error")):
+    """A gap in the data of a SupervisedStream while it restarted.
+
+    scanIndex: The index of the first missing scan.
+    startTime: The time.time() when the error was detected.
+    duration: The seconds from the error until the stream restarted.
+    numScans: The estimated number of missing scans, duration*scanRate
+        rounded. The scanIndex of the next block includes them.
+    error: The LJMError that stopped the stream, or None for a device
+        reconnect.
+    """
+    __slots__ = ()
+
+
+RECOVERABLE_STREAM_ERRORS = (
+    errorcodes.STREAM_NOT_RUNNING,
+    errorcodes.LJM_BUFFER_FULL,
+    errorcodes.COULD_NOT_START_STREAM,
+    errorcodes.SYNCHRONIZATION_TIMEOUT,
+    errorcodes.DEVICE_DISCONNECTED,
+    errorcodes.SOCKET_LEVEL_ERROR,
+    errorcodes.RECONNECT_FAILED,
+    errorcodes.CONNECTION_HAS_YIELDED_RECONNECT_FAILED,
+    errorcodes.USB_FAILURE
+    )
+
+
+class SupervisedStream(object):
+    """A stream that restarts itself after recoverable errors.
+
+    The stream configuration (the optional configuration registers, scan
+    list, scan rate and scansPerRead) is kept, and read restarts the
+    stream when eStreamRead raises an error in recoverableErrors or the
+    device reconnects. Failed restarts are retried with exponential
+    backoff. Each restart is reported by read as a StreamGap before the
+    next StreamBlock, so consumers can keep their time base.
+
+    Device reconnects are watched from start to stop alongside the
+    callback of registerDeviceReconnectCallback, which is not replaced.
+
+    Args:
+        handle: A valid handle to an open device.
+        aScanList: The scan list, as register names or addresses.
+        scanRate: The requested scan rate.
+        scansPerRead: The number of scans per eStreamRead.
+        aConfigNames, aConfigValues: Registers written with eWriteNames
+            before every start, such as STREAM_SETTLING_US.
+        recoverableErrors: The LJM error codes that restart the stream.
+        backoff: The seconds to wait before the first restart attempt.
+        maxBackoff: The longest wait between restart attempts.
+        maxRestarts: The number of consecutive failed restart attempts
+            after which the error is raised, or None to retry forever.
+
+    Attributes:
+        actualScanRate: The scan rate returned by the last eStreamStart.
+        numRestarts: The number of successful restarts.
+        gaps: The list of StreamGaps.
+
+    """
+    def __init__(self, handle, aScanList, scanRate, scansPerRead,
+                 aConfigNames=None, aConfigValues=None,
+                 recoverableErrors=RECOVERABLE_STREAM_ERRORS, backoff=0.1,
+                 maxBackoff=5.0, maxRestarts=None):
+        self.handle = handle
+        aScanList = list(aScanList)
+        if aScanList and isinstance(aScanList[0], str):
+            aScanList = ljm.namesToAddresses(len(aScanList), aScanList)[0]
+        self.aScanList = aScanList
+        self.scanRate = scanRate
+        self.scansPerRead = scansPerRead
+        self.aConfigNames = list(aConfigNames or [])
+        self.aConfigValues = list(aConfigValues or [])
+        self.recoverableErrors = recoverableErrors
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.maxRestarts = maxRestarts
+        self.actualScanRate = None
+        self.numRestarts = 0
+        self.gaps = []
+        self._scanIndex = 0
+        self._reconnected = False
+        self._running = False
+
+    def _onReconnect(self, handle):
+        # Called from an LJM thread. read restarts the stream.
+        self._reconnected = True
+
+    def _start(self):
+        if self.aConfigNames:
+            ljm.eWriteNames(self.handle, len(self.aConfigNames),
+                            self.aConfigNames, self.aConfigValues)
+        self.actualScanRate = ljm.eStreamStart(
+            self.handle, self.scansPerRead, len(self.aScanList),
+            self.aScanList, self.scanRate)
+        self._running = True
+
+    def start(self):
+        """Configures and starts the stream and watches for device
+        reconnects.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        ljm._addReconnectListener(self.handle, self._onReconnect)
+        self._reconnected = False
+        self._scanIndex = 0
+        self._start()
+
+    def stop(self):
+        """Stops the stream and the reconnect watch.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        ljm._removeReconnectListener(self.handle, self._onReconnect)
+        if self._running:
+            self._running = False
+            ljm.eStreamStop(self.handle)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def _restart(self, error):
+        startTime = time.time()
+        self._reconnected = False
+        if self._running:
+            self._running = False
+            try:
+                ljm.eStreamStop(self.handle)
+            except ljm.LJMError:
+                pass
+        wait = self.backoff
+        numAttempts = 0
+        while True:
+            time.sleep(wait)
+            try:
+                self._start()
+                break
+            except ljm.LJMError as excep:
+                numAttempts += 1
+                if excep.errorCode not in self.recoverableErrors or \
+                        (self.maxRestarts is not None and
+                         numAttempts >= self.maxRestarts):
+                    raise
+                wait = min(wait*2, self.maxBackoff)
+        self.numRestarts += 1
+        duration = time.time() - startTime
+        numScans = int(round(duration*self.actualScanRate))
+        gap = StreamGap(self._scanIndex, startTime, duration, numScans, error)
+        self._scanIndex += numScans
+        self.gaps.append(gap)
+        return gap
+
+    def read(self):
+        """Returns the next StreamBlock, or a StreamGap after restarting
+        the stream.
+
+        Raises:
+            LJMError: An error not in recoverableErrors was returned from
+                the LJM library call, or the stream could not be
+                restarted.
+
+        """
+        if self._reconnected:
+            return self._restart(None)
+        try:
+            aData, deviceScanBacklog, ljmScanBacklog = \
+                ljm.eStreamRead(self.handle)
+        except ljm.LJMError as excep:
+            if excep.errorCode not in self.recoverableErrors:
+                raise
+            return self._restart(excep)
+        block = StreamBlock(self._scanIndex, aData, deviceScanBacklog,
+                            ljmScanBacklog)
+        self._scanIndex += len(aData)//len(self.aScanList)
+        return block
+
+
+class AdaptiveStream(object):
+    """A stream whose block size is tuned to hold a target latency with
+    the fewest reads.
+
+    The latency of a scan is about the block duration (scansPerRead
+    divided by the scan rate) plus the scan backlogs' duration. Every
+    window reads, the block size is set to the largest one that fits
+    targetLatency given the average backlog. If the backlog grew during
+    the window, or the caller's processing time between reads was most
+    of the block duration, the reads cannot keep up and the block size
+    is doubled instead, which lowers the per-read overhead.
+
+    With rechunk, read fills each block with several eStreamReadInto
+    calls of the running stream, so a latency step to a multiple of the
+    stream's scansPerRead does not interrupt the stream. The stream is
+    restarted with the block size as its scansPerRead when the block size
+    is doubled, so each read returns more scans, or when it drops below
+    one read. Without rechunk, the stream is restarted with every new
+    scansPerRead. A restart loses the scans in between.
+
+    Args:
+        handle: A valid handle to an open device.
+        aScanList: The scan list, as register names or addresses.
+        scanRate: The requested scan rate.
+        targetLatency: The target latency in seconds.
+        minScansPerRead: The smallest block size, and the stream's first
+            scansPerRead with rechunk. Defaults to a sixteenth of the
+            target latency.
+        maxScansPerRead: The largest block size. Defaults to four times
+            the target latency.
+        rechunk: If True, blocks may be made of several reads of the
+            stream. Otherwise the stream is restarted at every change.
+        window: The number of reads between tuning steps.
+        log: A function called with a message each time the settings
+            change, such as print, or None.
+
+    Attributes:
+        scansPerRead: The current block size.
+        actualScanRate: The scan rate returned by eStreamStart.
+        history: The list of (time, scansPerRead, streamScansPerRead,
+            reason) settings chosen.
+        numRestarts: The number of restarts made to change scansPerRead.
+
+    """
+    def __init__(self, handle, aScanList, scanRate, targetLatency=0.1,
+                 minScansPerRead=None, maxScansPerRead=None, rechunk=True,
+                 window=8, log=None):
+        _requireNumpy()
+        self.handle = handle
+        aScanList = list(aScanList)
+        if aScanList and isinstance(aScanList[0], str):
+            aScanList = ljm.namesToAddresses(len(aScanList), aScanList)[0]
+        self.aScanList = aScanList
+        self.numAddresses = len(aScanList)
+        self.scanRate = scanRate
+        self.targetLatency = targetLatency
+        if minScansPerRead is None:
+            minScansPerRead = max(1, int(scanRate*targetLatency/16))
+        if maxScansPerRead is None:
+            maxScansPerRead = int(scanRate*targetLatency*4)
+        self.minScansPerRead = minScansPerRead
+        self.maxScansPerRead = max(maxScansPerRead, minScansPerRead)
+        if rechunk:
+            self.maxScansPerRead -= self.maxScansPerRead % minScansPerRead
+        self.rechunk = rechunk
+        self.window = window
+        self.log = log
+        self.scansPerRead = self._quantize(scanRate*targetLatency/2)
+        self.actualScanRate = None
+        self.history = []
+        self.numRestarts = 0
+        self._buffer = np.empty(self.maxScansPerRead*self.numAddresses)
+        self._streamScansPerRead = None
+        self._resetWindow()
+
+    def _quantize(self, numScans):
+        numScans = int(numScans)
+        if self.rechunk:
+            numScans -= numScans % self.minScansPerRead
+        return min(max(numScans, self.minScansPerRead), self.maxScansPerRead)
+
+    def _resetWindow(self):
+        self._numReads = 0
+        self._processTime = 0.0
+        self._backlogSum = 0
+        self._firstBacklog = None
+        self._lastBacklog = 0
+        self._lastReturn = None
+
+    def _record(self, reason):
+        entry = (time.time(), self.scansPerRead, self._streamScansPerRead,
+                 reason)
+        self.history.append(entry)
+        if self.log is not None:
+            self.log("AdaptiveStream: scansPerRead %d (stream %d) at %0.1f "
+                     "Hz: %s" % (self.scansPerRead, self._streamScansPerRead,
+                                 self.actualScanRate, reason))
+
+    def _startStream(self, streamScansPerRead):
+        self.actualScanRate = ljm.eStreamStart(
+            self.handle, streamScansPerRead, self.numAddresses,
+            self.aScanList, self.scanRate)
+        self._streamScansPerRead = streamScansPerRead
+
+    def start(self):
+        """Starts the stream.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        if self.rechunk:
+            self._startStream(self.minScansPerRead)
+        else:
+            self._startStream(self.scansPerRead)
+        self._resetWindow()
+        self._record("start")
+
+    def stop(self):
+        """Stops the stream.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        if self._streamScansPerRead is not None:
+            self._streamScansPerRead = None
+            ljm.eStreamStop(self.handle)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.stop()
+
+    def _tune(self):
+        blockTime = float(self.scansPerRead)/self.actualScanRate
+        processTime = self._processTime/max(self._numReads - 1, 1)
+        backlogTime = float(self._backlogSum)/self._numReads/ \
+            self.actualScanRate
+        grow = True
+        if self._lastBacklog > self._firstBacklog + self.scansPerRead:
+            numScans = self.scansPerRead*2
+            reason = "backlog grew to %d scans" % self._lastBacklog
+        elif processTime > 0.8*blockTime:
+            numScans = self.scansPerRead*2
+            reason = "processing took %0.1f ms of %0.1f ms blocks" % \
+                (processTime*1000, blockTime*1000)
+        elif backlogTime >= self.targetLatency:
+            # Smaller blocks would not help the backlog drain.
+            grow = False
+            numScans = self.scansPerRead
+            reason = "backlog %0.1f ms" % (backlogTime*1000)
+        else:
+            grow = False
+            numScans = (self.targetLatency - backlogTime)*self.actualScanRate
+            reason = "latency %0.1f ms, backlog %0.1f ms" % \
+                ((blockTime + backlogTime)*1000, backlogTime*1000)
+        numScans = self._quantize(numScans)
+        if self.rechunk and not grow and \
+                numScans >= self._streamScansPerRead:
+            # Keep whole reads of the running stream.
+            numScans -= numScans % self._streamScansPerRead
+        # Ignore small changes, which would make the size flap.
+        if numScans*4 > self.scansPerRead*5 or \
+                numScans*5 < self.scansPerRead*4:
+            self.scansPerRead = numScans
+            if not self.rechunk or grow or \
+                    numScans % self._streamScansPerRead:
+                ljm.eStreamStop(self.handle)
+                self._streamScansPerRead = None
+                self._startStream(numScans)
+                self.numRestarts += 1
+            self._record(reason)
+
+    def read(self):
+        """Reads the next block.
+
+        Returns:
+            A tuple containing:
+            (aData, deviceScanBacklog, ljmScanBacklog)
+
+            aData: A float64 NumPy array of scansPerRead*numAddresses
+                interleaved values. It is reused by the next read.
+            deviceScanBacklog, ljmScanBacklog: The backlogs of the last
+                eStreamReadInto of the block.
+
+        Raises:
+            LJMError: An error was returned from the LJM library call.
+
+        """
+        now = time.time()
+        if self._lastReturn is not None:
+            self._processTime += now - self._lastReturn
+        chunkSize = self._streamScansPerRead*self.numAddresses
+        aData = self._buffer[:self.scansPerRead*self.numAddresses]
+        for start in range(0, len(aData), chunkSize):
+            deviceScanBacklog, ljmScanBacklog = ljm.eStreamReadInto(
+                self.handle, aData[start:start + chunkSize])
+        backlog = deviceScanBacklog + ljmScanBacklog
+        if self._firstBacklog is None:
+            self._firstBacklog = backlog
+        self._lastBacklog = backlog
+        self._backlogSum += backlog
+        self._numReads += 1
+        if self._numReads >= self.window:
+            self._tune()
+            self._resetWindow()
+        self._lastReturn = time.time()
+        return aData, deviceScanBacklog, ljmScanBacklog
+
+
+class StatisticsSnapshot(collections.namedtuple(
+        "StatisticsSnapshot", "numScans mean variance rms minimum maximum "
+        "histogram histogramEdges")):
+    """Per-channel statistics of a StreamStatistics at one block. The
+    arrays are read-only and have one value per channel.
+
+    numScans: The number of scans accumulated.
+    mean, variance, rms, minimum, maximum: The statistics. variance is the
+        population variance. They are NaN before any scans.
+    histogram: A (numChannels, numBins) array of counts, or None. Values
+        outside the histogram range are counted in the first or last bin.
+    histogramEdges: The numBins + 1 bin edges, or None.
+    """
+    __slots__ = ()
+
+
+class StreamStatistics(object):
+    """Running per-channel mean, variance, RMS, minimum, maximum and
+    histogram of stream blocks.
+
+    Each block is reduced with NumPy and merged into the running values
+    with the parallel form of Welford's algorithm, so the cost per block
+    does not depend on the number of scans already seen. After each block
+    a new StatisticsSnapshot is built and assigned to the snapshot
+    attribute. Other threads read snapshot without a lock: the
+    assignment is atomic and a snapshot is never modified.
+
+    Args:
+        numChannels: The number of addresses in the scan list.
+        histogramRange: The (low, high) range of the histogram, or None
+            for no histogram.
+        numBins: The number of histogram bins.
+
+    Attributes:
+        snapshot: The latest StatisticsSnapshot.
+
+    """
+    def __init__(self, numChannels, histogramRange=None, numBins=64):
+        _requireNumpy()
+        self.numChannels = numChannels
+        self.histogramRange = histogramRange
+        self.numBins = numBins
+        if histogramRange is None:
+            self._edges = None
+        else:
+            self._edges = np.linspace(histogramRange[0], histogramRange[1],
+                                      numBins + 1)
+            self._edges.flags.writeable = False
+            self._binOffsets = (np.arange(numChannels)*numBins)[:, None]
+        self.reset()
+
+    def reset(self):
+        """Clears the statistics."""
+        numChannels = self.numChannels
+        self._numScans = 0
+        self._mean = np.zeros(numChannels)
+        self._m2 = np.zeros(numChannels)
+        self._sumSquares = np.zeros(numChannels)
+        self._min = np.full(numChannels, np.inf)
+        self._max = np.full(numChannels, -np.inf)
+        if self._edges is None:
+            self._histogram = None
+        else:
+            self._histogram = np.zeros((numChannels, self.numBins),
+                                       dtype=np.int64)
+        self._publish()
+
+    def _publish(self):
+        def frozen(values):
+            values = values.copy()
+            values.flags.writeable = False
+            return values
+
+        numScans = self._numScans
+        if numScans:
+            mean = frozen(self._mean)
+            variance = frozen(self._m2/numScans)
+            rms = frozen(np.sqrt(self._sumSquares/numScans))
+            minimum = frozen(self._min)
+            maximum = frozen(self._max)
+        else:
+            mean = variance = rms = minimum = maximum = \
+                frozen(np.full(self.numChannels, np.nan))
+        histogram = None
+        if self._histogram is not None:
+            histogram = frozen(self._histogram)
+        self.snapshot = StatisticsSnapshot(numScans, mean, variance, rms,
+                                           minimum, maximum, histogram,
+                                           self._edges)
+
+    def process(self, block):
+        """Adds a (numChannels, numScans) block, as returned by
+        deinterleave, and returns the new snapshot.
+        """
+        numNew = block.shape[1]
+        if numNew == 0:
+            return self.snapshot
+        blockMean = block.mean(axis=1)
+        deviations = block - blockMean[:, None]
+        blockM2 = (deviations*deviations).sum(axis=1)
+        numOld = self._numScans
+        total = numOld + numNew
+        delta = blockMean - self._mean
+        self._mean += delta*(float(numNew)/total)
+        self._m2 += blockM2 + delta*delta*(float(numOld)*numNew/total)
+        self._numScans = total
+        self._sumSquares += (block*block).sum(axis=1)
+        np.minimum(self._min, block.min(axis=1), out=self._min)
+        np.maximum(self._max, block.max(axis=1), out=self._max)
+        if self._histogram is not None:
+            low, high = self.histogramRange
+            bins = ((block - low)*(self.numBins/float(high - low))).astype(
+                np.int64)
+            np.clip(bins, 0, self.numBins - 1, out=bins)
+            bins += self._binOffsets
+            self._histogram += np.bincount(
+                bins.ravel(), minlength=self._histogram.size).reshape(
+                    self._histogram.shape)
+        self._publish()
+        return self.snapshot
+
+    def processInterleaved(self, aData):
+        """Adds a block of interleaved stream data and returns the new
+        snapshot.
+        """
+        return self.process(deinterleave(aData, self.numChannels))
+
+    def dataCallback(self, handle, aData, deviceScanBacklog, ljmScanBacklog,
+                     error):
+        """A callback for setStreamDataCallback that adds each block.
+        Read errors are ignored.
+        """
+        if error is None:
+            self.processInterleaved(aData)
+
+
+class WelchSpectrum(object):
+    """Per-channel power spectral density of stream data by Welch's
+    method: overlapped, windowed and mean-detrended segments, each
+    transformed with a real FFT, and the last numAverages segment
+    spectra averaged.
+
+    Samples that do not complete a segment are carried to the next
+    block, so segments span block boundaries. Only the last numAverages
+    segment spectra are kept.
+
+    Args:
+        numChannels: The number of addresses in the scan list.
+        scanRate: The scan rate, in Hz.
+        segmentLength: The number of scans per segment.
+        overlap: The number of scans shared by consecutive segments.
+            Defaults to half of segmentLength.
+        window: "hann", None for a rectangular window, or an array of
+            segmentLength weights.
+        numAverages: The number of segment spectra averaged.
+
+    Attributes:
+        frequencies: The frequency of each spectrum bin, in Hz.
+        numSegments: The number of segments transformed.
+
+    """
+    def __init__(self, numChannels, scanRate, segmentLength=1024,
+                 overlap=None, window="hann", numAverages=16):
+        _requireNumpy()
+        if overlap is None:
+            overlap = segmentLength//2
+        if not 0 <= overlap < segmentLength:
+            raise ValueError("overlap must be less than segmentLength.")
+        self.numChannels = numChannels
+        self.scanRate = float(scanRate)
+        self.segmentLength = segmentLength
+        self.overlap = overlap
+        self.numAverages = numAverages
+        if window is None:
+            window = np.ones(segmentLength)
+        elif isinstance(window, str):
+            if window != "hann":
+                raise ValueError("Unsupported window %r." % (window, ))
+            # The periodic Hann window, as used for spectral analysis.
+            window = 0.5 - 0.5*np.cos(2*np.pi*np.arange(segmentLength)/
+                                      segmentLength)
+        self.window = np.asarray(window, dtype=np.float64)
+        if self.window.shape != (segmentLength, ):
+            raise ValueError("window must have segmentLength values.")
+        # One-sided density scaling. The DC and Nyquist bins are not
+        # doubled.
+        numFrequencies = segmentLength//2 + 1
+        self._scale = np.full(numFrequencies, 2.0)
+        self._scale[0] = 1.0
+        if segmentLength % 2 == 0:
+            self._scale[-1] = 1.0
+        self._scale /= self.scanRate*(self.window*self.window).sum()
+        self.frequencies = np.fft.rfftfreq(segmentLength, 1.0/self.scanRate)
+        self.reset()
+
+    def reset(self):
+        """Clears the carried samples and the spectra."""
+        self._pending = np.empty((self.numChannels, 0))
+        self._history = np.zeros((self.numAverages, self.numChannels,
+                                  len(self.frequencies)))
+        self._latest = None
+        self.numSegments = 0
+
+    def process(self, block):
+        """Adds a (numChannels, numScans) block, as returned by
+        deinterleave, and returns the number of new segments.
+        """
+        data = np.concatenate((self._pending, block), axis=1)
+        hop = self.segmentLength - self.overlap
+        numNew = 0
+        if data.shape[1] >= self.segmentLength:
+            numNew = (data.shape[1] - self.segmentLength)//hop + 1
+        if numNew:
+            rowStride, colStride = data.strides
+            segments = np.lib.stride_tricks.as_strided(
+                data, shape=(self.numChannels, numNew, self.segmentLength),
+                strides=(rowStride, colStride*hop, colStride),
+                writeable=False)
+            segments = segments - segments.mean(axis=2)[:, :, None]
+            spectra = np.fft.rfft(segments*self.window, axis=2)
+            power = (spectra.real**2 + spectra.imag**2)*self._scale
+            # Keep the last numAverages in a ring.
+            for i in range(max(numNew - self.numAverages, 0), numNew):
+                slot = (self.numSegments + i) % self.numAverages
+                self._history[slot] = power[:, i]
+            self._latest = power[:, -1]
+            self.numSegments += numNew
+        self._pending = data[:, numNew*hop:].copy()
+        return numNew
+
+    def processInterleaved(self, aData):
+        """Adds a block of interleaved stream data and returns the number
+        of new segments.
+        """
+        return self.process(deinterleave(aData, self.numChannels))
+
+    @property
+    def latestSpectrum(self):
+        """The (numChannels, numFrequencies) PSD of the last segment, in
+        units squared per Hz, or None before the first segment.
+        """
+        return self._latest
+
+    @property
+    def averagedPSD(self):
+        """The (numChannels, numFrequencies) PSD averaged over the last
+        numAverages segments, or None before the first segment.
+        """
+        numAveraged = min(self.numSegments, self.numAverages)
+        if numAveraged == 0:
+            return None
+        # Unused slots are zero.
+        return self._history.sum(axis=0)/numAveraged
+
+
+def streamBurstArray(handle, aScanList, scanRate, numScans, out=None,
+                     progressCallback=None, scansPerRead=None):
+    """Collects a stream burst into a float64 NumPy array with
+    labjack.ljm.streamBurstInto and returns it de-interleaved.
+
+    Args:
+        handle: A valid handle to an open device.
+        aScanList: The scan list, as register names or addresses.
+        scanRate: The requested scan rate.
+        numScans: The number of scans to collect.
+        out: A C-contiguous float64 array of at least
+            numScans*len(aScanList) values to collect into, such as a
+            np.memmap for bursts larger than memory, or None to allocate
+            one.
+        progressCallback, scansPerRead: See streamBurstInto.
+
+    Returns:
+        A tuple containing:
+        (scanRate, data)
+
+        scanRate: The actual scan rate.
+        data: A (numAddresses, numScans) view of out, one row per
+            address.
+
+    Raises:
+        LJMError: An error was returned from the LJM library call.
+        ValueError: out is too small or not C doubles.
+
+    """
+    _requireNumpy()
+    aScanList = list(aScanList)
+    if aScanList and isinstance(aScanList[0], str):
+        aScanList = ljm.namesToAddresses(len(aScanList), aScanList)[0]
+    numValues = numScans*len(aScanList)
+    if out is None:
+        out = np.empty(numValues)
+    elif out.dtype != np.float64 or not out.flags.c_contiguous:
+        # reshape would copy, and the burst would not reach out.
+        raise ValueError("out must be a C-contiguous float64 array.")
+    out = out.reshape(-1)[:numValues]
+    scanRate = ljm.streamBurstInto(handle, len(aScanList), aScanList,
+                                   scanRate, numScans, out, progressCallback,
+                                   scansPerRead)
+    return scanRate, deinterleave(out, len(aScanList))